@@ -1,11 +1,24 @@
 import configparser
 from enum import Enum
 import atexit
+import os
+import io
+import re
+import math
+import time
+import threading
+from collections import deque
+from traceback import print_exc
 import server.gui_positions as gp
+from server.alerts import RULE_KEYS
 from datetime import datetime
 
 
 confFile = 'config.cfg'
+# Write-behind, changes are written WRITE_DELAY seconds after the first
+# one and writes are at least MIN_WRITE_INTERVAL apart, 60 an hour at most
+WRITE_DELAY = 10
+MIN_WRITE_INTERVAL = 60
 ## --------------------------------------------------------------
 ## Widget names, these can be called through 
 ## interface.ToggleFrame("name")
@@ -49,55 +62,352 @@ frameWeights = {
 MirrorTTL = 60 #in seconds
 NotifTTL = 10
 AlexaTTL = 10
-config = configparser.ConfigParser()
+# Motion sensor
+PIRPin = 7
+PIRWarmup = 15		# seconds
+PIRDebounce = 200	# milliseconds
+PIRHoldOff = 2		# seconds
+# (latitude, longitude, name) to skip IP geolocation, None to look it up
+FixedLocation = None
+# Thunderboard device ID -> room name, boards not listed get their own room
+BoardRooms = dict()
+# Seconds between Thunderboard samples by power source while the display is
+# (on, off). The off interval still has to be short enough for the alerts.
+SamplingPolicies = {
+	'usb': (0.2, 30),
+	'battery': (1, 60),		# AA and AAA
+	'coin': (2, 120)		# coin cell, no gas sensor
+}
+# Sensor alerts, checked against the worst room. Each rule needs a metric,
+# above or below, and a message. Hysteresis is how far the value has to move
+# back before the rule re-arms, cooldown the seconds between repeats (0 = once)
+# and clear an optional message for when it re-arms. The most severe active
+# rule of a metric is the one shown.
+AlertRules = [
+	{'name': 'temperature_high', 'metric': 'temperature', 'above': 30,
+		'hysteresis': 1, 'cooldown': 0, 'severity': 1,
+		'message': 'Ambient Temperature above 30 celsius!', 'clear': ''},
+	{'name': 'co2_bad', 'metric': 'co2', 'above': 1000,
+		'hysteresis': 50, 'cooldown': 600, 'severity': 1,
+		'message': 'CO2 levels above recommended, open the windows.',
+		'clear': 'CO2 levels are back to normal.'},
+	{'name': 'co2_critical', 'metric': 'co2', 'above': 2000,
+		'hysteresis': 100, 'cooldown': 60, 'severity': 2,
+		'message': 'CO2 levels are critical, air the room immidiately!', 'clear': ''}
+]
+ALERT_SECTION = 'ALERT '
+ALERT_MARKER = 'ALERTS'		# written with the rules, without it a file keeps the default rules
+# Layouts saved through /layout, name -> {'positions': {widget: position name},
+# 'weights': {widget: weight}, 'shown': [widgets on screen]}
+NamedLayouts = dict()
+LAYOUT_SECTION = 'LAYOUT '
+LAYOUT_NAME = re.compile(r'[A-Za-z0-9_ -]+')	# names that fit in a section header
+config = configparser.ConfigParser()	# the file as loaded, for sections kept as they are
+# Held by every thread that changes or reads the settings above
+# while others may: the GUI's layout, the config watcher and Render.
+# Never held while waiting for writeLock.
+settingsLock = threading.RLock()
+writeLock = threading.Lock()
+writeTimer = None			# pending write while dirty
+lastWrite = float('-inf')	# monotonic time of the last write
+written = None				# config text for the settings in the file on disk
+loadFailed = False			# the file on disk didn't load, it is never overwritten
+writeTimes = deque()		# monotonic times of the writes in the last hour
+writeCounts = {'changes': 0, 'writes': 0, 'unchanged': 0, 'refused': 0}
+
+
+# Owned by the GUI's layout engine once it runs, changes go through it
+LIVE_KEYS = ('framePositions', 'frameWeights')
+WIDGET_NAMES = (NEWS_NAME, GUIDE_NAME, ALEXA_NAME, NOTIF_NAME, WEATHER_NAME,
+	CLOCK_NAME, SENSORS_NAME)
+# Shown only by the notification scheduler, with an expiry
+OVERLAY_NAMES = (ALEXA_NAME, NOTIF_NAME)
 
 
-def main():		
+def main():
+	''' Loads config.cfg over the defaults. A file with an invalid
+	value leaves every default and is kept as it is, until it
+	loads. '''
+	global loadFailed
 	try:
-		config.read(confFile)
-		# Assigning config to variables outside of function scope
-		global MirrorTTL
-		MirrorTTL = int(config['Mirror']['MirrorTTL'])
-		global NotifTTL
-		NotifTTL = int(config['Mirror']['NotifTTL'])
-		global AlexaTTL
-		AlexaTTL = int(config['Mirror']['AlexaTTL'])
-		framePositions[NEWS_NAME] = gp.PositionResolver(str(config['WIDGET_POSITIONS'][NEWS_NAME].name))
-		framePositions[GUIDE_NAME] = gp.PositionResolver(str(config['WIDGET_POSITIONS'][GUIDE_NAME].name))
-		framePositions[ALEXA_NAME] = gp.PositionResolver(str(config['WIDGET_POSITIONS'][ALEXA_NAME].name))
-		framePositions[NOTIF_NAME] = gp.PositionResolver(str(config['WIDGET_POSITIONS'][NOTIF_NAME].name))
-		framePositions[WEATHER_NAME] = gp.PositionResolver(str(config['WIDGET_POSITIONS'][WEATHER_NAME].name))
-		framePositions[CLOCK_NAME] = gp.PositionResolver(str(config['WIDGET_POSITIONS'][CLOCK_NAME].name))
-		framePositions[SENSORS_NAME] = gp.PositionResolver(str(config['WIDGET_POSITIONS'][SENSORS_NAME].name))
-		frameWeights[NEWS_NAME] = (float(config['WIDGET_WEIGHTS'][NEWS_NAME]))
-		frameWeights[GUIDE_NAME] = (float(config['WIDGET_WEIGHTS'][GUIDE_NAME]))
-		frameWeights[ALEXA_NAME] = (float(config['WIDGET_WEIGHTS'][ALEXA_NAME]))
-		frameWeights[NOTIF_NAME] = (float(config['WIDGET_WEIGHTS'][NOTIF_NAME]))
-		frameWeights[WEATHER_NAME] = (float(config['WIDGET_WEIGHTS'][WEATHER_NAME]))
-		frameWeights[CLOCK_NAME] = (float(config['WIDGET_WEIGHTS'][CLOCK_NAME]))
-		frameWeights[SENSORS_NAME] = (float(config['WIDGET_WEIGHTS'][SENSORS_NAME]))
-	except (IOError, KeyError):
+		with open(confFile) as configfile:
+			text = configfile.read()
+		Apply(Diff(Parse(text)))
+		config.read_string(text)
+		Loaded()
+	except OSError:
 		print("Config not found.")
-		
+	except (ValueError, KeyError, configparser.Error) as e:
+		print("Config not loaded, using defaults: " + str(e))
+		with writeLock:
+			loadFailed = True
+
+
+def Parse(_text: str) -> dict:
+	''' Settings found in config file text, by global name.
+	Raises ValueError, KeyError or configparser.Error if a
+	value is invalid. '''
+	parser = configparser.ConfigParser()
+	parser.read_string(_text)
+	settings = dict()
+	for key in ('MirrorTTL', 'NotifTTL', 'AlexaTTL'):
+		if parser.has_option('Mirror', key):
+			settings[key] = parser.getint('Mirror', key)
+			if settings[key] <= 0:
+				raise ValueError(key + " has to be positive")
+	for key, read in (('PIRPin', parser.getint), ('PIRWarmup', parser.getfloat),
+			('PIRDebounce', parser.getint), ('PIRHoldOff', parser.getfloat)):
+		if parser.has_option('PIR', key):
+			settings[key] = read('PIR', key)
+	if parser.has_section('Location'):
+		settings['FixedLocation'] = None
+		if parser.get('Location', 'Latitude', fallback='') and \
+				parser.get('Location', 'Longitude', fallback=''):
+			settings['FixedLocation'] = (parser.getfloat('Location', 'Latitude'),
+				parser.getfloat('Location', 'Longitude'),
+				parser.get('Location', 'Name', fallback=''))
+	rules = []
+	found = parser.has_section(ALERT_MARKER)
+	for section in parser.sections():
+		if section.startswith(ALERT_SECTION):
+			found = True
+			try:
+				rules.append(ReadAlertRule(section, parser[section]))
+			except ValueError as e:
+				print("Alert rule skipped: " + str(e))
+	if found:		# No sections under the marker, no alerts
+		settings['AlertRules'] = rules
+	layouts = dict()
+	for section in parser.sections():
+		if section.startswith(LAYOUT_SECTION):
+			try:
+				if not LAYOUT_NAME.fullmatch(section[len(LAYOUT_SECTION):]):
+					raise ValueError("name can only have letters, digits, spaces, _ and -")
+				layouts[section[len(LAYOUT_SECTION):]] = ReadLayout(parser[section])
+			except ValueError as e:
+				print("Layout " + section[len(LAYOUT_SECTION):] + " skipped: " + str(e))
+	settings['NamedLayouts'] = layouts
+	if parser.has_section('SAMPLING'):
+		policies = dict(SamplingPolicies)
+		for source, intervals in parser['SAMPLING'].items():
+			active, idle = intervals.split(',')
+			policies[source] = (float(active), float(idle))
+		settings['SamplingPolicies'] = policies
+	settings['BoardRooms'] = dict()
+	if parser.has_section('ROOMS'):
+		settings['BoardRooms'] = {int(deviceId): room
+			for deviceId, room in parser['ROOMS'].items()}
+	if parser.has_section('WIDGET_POSITIONS'):
+		positions = dict()
+		for name, value in parser['WIDGET_POSITIONS'].items():
+			if name in WIDGET_NAMES:
+				positions[name] = gp.PositionResolver(value.strip())
+				if positions[name] is None:
+					raise ValueError("Unknown position " + value + " for " + name)
+		settings['framePositions'] = positions
+	if parser.has_section('WIDGET_WEIGHTS'):
+		settings['frameWeights'] = {name: float(value) for name, value
+			in parser['WIDGET_WEIGHTS'].items() if name in WIDGET_NAMES}
+	return settings
+
+
+def Diff(_settings: dict) -> dict:
+	''' The parsed settings that differ from the current ones.
+	Widget positions and weights only list the widgets that
+	changed. '''
+	changes = dict()
+	with settingsLock:
+		for name, value in _settings.items():
+			current = globals()[name]
+			if name in LIVE_KEYS:
+				changed = {widget: item for widget, item in value.items()
+					if current.get(widget) != item}
+				if changed:
+					changes[name] = changed
+			elif current != value:
+				changes[name] = value
+	return changes
+
+
+def Apply(_changes: dict):
+	''' Stores changed settings. Widget positions and weights are
+	updated in place for the layout engine, everything else is
+	replaced in one step, so a thread reading a setting sees the
+	old or the new one. Modules that hold on to one are handed the
+	new one by server.ReloadConfig. '''
+	with settingsLock:
+		for name, value in _changes.items():
+			if name in LIVE_KEYS:
+				globals()[name].update(value)
+			else:
+				globals()[name] = value
+
+
+def ReadAlertRule(_section: str, _options) -> dict:
+	rule = {'name': _section[len(ALERT_SECTION):]}
+	for key, value in _options.items():
+		if key not in RULE_KEYS or key == 'name':
+			raise ValueError("Alert " + rule['name'] + " has an unknown setting " + key)
+		elif key in ('above', 'below', 'hysteresis', 'cooldown'):
+			rule[key] = float(value)
+		elif key == 'severity':
+			rule[key] = int(value)
+		else:
+			rule[key] = value
+	if 'metric' not in rule or 'message' not in rule or \
+			('above' in rule) == ('below' in rule):
+		raise ValueError("Alert " + rule['name'] + " needs a metric, a message and above or below")
+	return rule
+
+
+def ReadLayout(_options) -> dict:
+	''' Raises ValueError for unknown widgets or positions and
+	weights that aren't finite. Overlays are never part of what a
+	layout shows. '''
+	layout = {'positions': dict(), 'weights': dict(), 'shown': []}
+	for key, value in _options.items():
+		if key == 'shown':
+			layout['shown'] = [name.strip() for name in value.split(',')
+				if name.strip() and name.strip() not in OVERLAY_NAMES]
+		elif key in WIDGET_NAMES:
+			position, weight = value.split(',')
+			if gp.PositionResolver(position.strip()) is None:
+				raise ValueError("unknown position " + position.strip() + " for " + key)
+			layout['positions'][key] = position.strip()
+			layout['weights'][key] = float(weight)
+			if not math.isfinite(layout['weights'][key]):
+				raise ValueError("weight of " + key + " has to be finite")
+		else:
+			raise ValueError("unknown widget " + key)
+	for name in layout['shown']:
+		if name not in WIDGET_NAMES:
+			raise ValueError("unknown widget " + name + " shown")
+	return layout
+
+
+def MarkDirty():
+	''' Schedules a write for a changed setting, changes until
+	the write happens go into the same write '''
+	global writeTimer
+	with writeLock:
+		writeCounts['changes'] += 1
+		if writeTimer is not None:
+			return
+		delay = max(WRITE_DELAY, lastWrite + MIN_WRITE_INTERVAL - time.monotonic())
+		writeTimer = threading.Timer(delay, Write)
+		writeTimer.daemon = True
+		writeTimer.start()
+
+
+def WriteStats() -> dict:
+	with writeLock:
+		hourAgo = time.monotonic() - 3600
+		while writeTimes and writeTimes[0] < hourAgo:
+			writeTimes.popleft()
+		stats = dict(writeCounts)
+		stats['writesLastHour'] = len(writeTimes)
+		stats['pending'] = writeTimer is not None
+		return stats
+
+
+def Loaded():
+	''' Marks the current settings as the ones in the file, a
+	write only happens once they differ from it. Skipped while
+	a write is pending, the settings then hold a change the file
+	doesn't have yet. '''
+	global written, loadFailed
+	with writeLock:
+		loadFailed = False
+		if writeTimer is not None:
+			return
+		written = Render()
+
 
 def Write():
-	config['Mirror'] = {'MirrorTTL':MirrorTTL,
-							'NotifTTL':NotifTTL,
-							'AlexaTTL':AlexaTTL}
-	config.set("Mirror", "; TTL values are in seconds.", "")
-	config['WIDGET_POSITIONS'] = {
-							NEWS_NAME:framePositions[NEWS_NAME].name,
-							CLOCK_NAME:framePositions[CLOCK_NAME].name,
-							WEATHER_NAME:framePositions[WEATHER_NAME].name,
-							SENSORS_NAME:framePositions[SENSORS_NAME].name,
-							GUIDE_NAME:framePositions[GUIDE_NAME].name,
-							ALEXA_NAME:framePositions[ALEXA_NAME].name,
-							NOTIF_NAME:framePositions[NOTIF_NAME].name}
-	config.set('WIDGET_POSITIONS', "; Avaliable values are: TOPLEFT,TOPMID " +
-    	"TOPRIGHT, MIDLEFT, MID, MIDRIGHT \nBOTLEFT, BOTMID, BOTRIGHT", "")
-	config['WIDGET_WEIGHTS'] = frameWeights
-	with open(confFile, 'w') as configfile:
-		config.write(configfile)
+	''' Writes the config if the settings differ from the file,
+	through a temporary file so a power cut leaves either the
+	old or the new file. Never replaces a file that didn't load. '''
+	global writeTimer, lastWrite, written
+	with writeLock:
+		if writeTimer is not None:
+			writeTimer.cancel()
+			writeTimer = None
+		if loadFailed:
+			writeCounts['refused'] += 1
+			print("Config not written, " + confFile + " didn't load, fix it to save changes")
+			return
+		lastWrite = time.monotonic()
+		text = Render()
+		if text == written:
+			writeCounts['unchanged'] += 1
+			return
+		try:
+			tmpFile = confFile + '.tmp'
+			with open(tmpFile, 'w') as configfile:
+				configfile.write(text)
+				configfile.flush()
+				os.fsync(configfile.fileno())
+			os.replace(tmpFile, confFile)
+			written = text
+			writeCounts['writes'] += 1
+			writeTimes.append(lastWrite)
+		except OSError:
+			print_exc()
+
+
+def Render() -> str:
+	''' The config file contents for the current settings. Built
+	in a parser of its own, so removed alert rules and layouts
+	drop out, sections this module doesn't know are kept. '''
+	parser = configparser.ConfigParser()
+	with settingsLock:
+		parser['Mirror'] = {'MirrorTTL':MirrorTTL,
+								'NotifTTL':NotifTTL,
+								'AlexaTTL':AlexaTTL}
+		parser.set("Mirror", "; TTL values are in seconds.", "")
+		parser['PIR'] = {'PIRPin':PIRPin,
+								'PIRWarmup':PIRWarmup,
+								'PIRDebounce':PIRDebounce,
+								'PIRHoldOff':PIRHoldOff}
+		parser.set("PIR", "; Debounce is in milliseconds, warmup and hold-off in seconds.", "")
+		latitude, longitude, name = FixedLocation or ('', '', '')
+		parser['Location'] = {'Latitude':latitude,
+								'Longitude':longitude,
+								'Name':name}
+		parser.set("Location", "; Leave empty to find the location from the public IP.", "")
+		parser['SAMPLING'] = {source: "%g, %g" % intervals
+								for source, intervals in SamplingPolicies.items()}
+		parser.set('SAMPLING', "; Power source = seconds between samples with the display on, off", "")
+		parser[ALERT_MARKER] = {}
+		parser.set(ALERT_MARKER, "; Alert rules are the ALERT <name> sections, none means no alerts.", "")
+		for rule in AlertRules:
+			parser[ALERT_SECTION + rule['name']] = {key: value for key, value
+				in rule.items() if key != 'name'}
+		for name, layout in NamedLayouts.items():
+			section = {widget: "%s, %s" % (position, layout['weights'][widget])
+				for widget, position in layout['positions'].items()}
+			section['shown'] = ", ".join(layout['shown'])
+			parser[LAYOUT_SECTION + name] = section
+		parser['ROOMS'] = {str(deviceId):room for deviceId, room in BoardRooms.items()}
+		parser.set('ROOMS', "; Thunderboard device ID = room name, readings are combined per room", "")
+		parser['WIDGET_POSITIONS'] = {
+								NEWS_NAME:framePositions[NEWS_NAME].name,
+								CLOCK_NAME:framePositions[CLOCK_NAME].name,
+								WEATHER_NAME:framePositions[WEATHER_NAME].name,
+								SENSORS_NAME:framePositions[SENSORS_NAME].name,
+								GUIDE_NAME:framePositions[GUIDE_NAME].name,
+								ALEXA_NAME:framePositions[ALEXA_NAME].name,
+								NOTIF_NAME:framePositions[NOTIF_NAME].name}
+		parser.set('WIDGET_POSITIONS', "; Avaliable values are: TOPLEFT,TOPMID " +
+			"TOPRIGHT, MIDLEFT, MID, MIDRIGHT \nBOTLEFT, BOTMID, BOTRIGHT", "")
+		parser['WIDGET_WEIGHTS'] = frameWeights
+	for section in config.sections():
+		if not parser.has_section(section) and not section.startswith(ALERT_SECTION) \
+				and not section.startswith(LAYOUT_SECTION):
+			parser[section] = dict(config.items(section, raw=True))
+	text = io.StringIO()
+	parser.write(text)
+	return text.getvalue()
 
 
 
@@ -4,7 +4,8 @@ import sys
 # Change working directory of this scripts directory, if it is run from somewhere else
 os.chdir(os.path.dirname(os.path.realpath(sys.argv[0])))
 
-from server import flask
-# server/__init__.py runs at this import
+from server import flask, boot
+# server/__init__.py runs at this import, the subsystems boot in the background
+boot.Wait('api')
 
 flask.run(host='0.0.0.0', port=5005, threaded = True, ssl_context=('certs/cert.pem', 'certs/key.pem'))
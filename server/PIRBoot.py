@@ -1,52 +1,172 @@
 #!/usr/bin/python3
-import RPi.GPIO as GPIO
 import time
 import threading
 
+try:
+	import RPi.GPIO as GPIO
+except ImportError:			# Not running on a Pi
+	GPIO = None
 
-GPIO.setmode(GPIO.BCM)
-PIR_PIN = 7 
-GPIO.setup(PIR_PIN, GPIO.IN)
+PIR_PIN = 7
+WARMUP = 15					# seconds the sensor needs to settle after power on
+DEBOUNCE = 200				# milliseconds, passed to the GPIO edge detection
+HOLDOFF = 2					# seconds, motion events closer than this are dropped
+
+
+class FakeGPIO():
+	''' Stand-in for RPi.GPIO with the calls SensorService uses.
+		Trigger() raises the pin like the PIR would and Release()
+		drops it, so the motion to wake path can be run and timed
+		without a Pi.
+	'''
+	BCM = 11
+	IN = 1
+	RISING = 31
+	BOTH = 33
+
+	def __init__(self):
+		self.levels = dict()
+		self.callbacks = dict()
+		self.lastEdge = dict()
+
+	def setmode(self, _mode):
+		pass
+
+	def setup(self, _pin, _direction):
+		self.levels[_pin] = 0
+
+	def input(self, _pin) -> int:
+		return self.levels.get(_pin, 0)
+
+	def add_event_detect(self, _pin, _edge, callback=None, bouncetime=0):
+		self.callbacks[_pin] = (callback, bouncetime / 1000)
+		self.lastEdge[_pin] = float('-inf')
+
+	def remove_event_detect(self, _pin):
+		self.callbacks.pop(_pin, None)
+
+	def cleanup(self):
+		self.callbacks.clear()
+
+	def Trigger(self, _pin=PIR_PIN):
+		''' Rising edge on the pin. Callbacks run on their own
+			thread, the same as RPi.GPIO does it. Returns the thread
+			or None if the edge was bounced or nobody listens. '''
+		self.levels[_pin] = 1
+		return self.__Edge(_pin)
+
+	def Release(self, _pin=PIR_PIN):
+		''' Falling edge on the pin, see Trigger() '''
+		self.levels[_pin] = 0
+		return self.__Edge(_pin)
+
+	def __Edge(self, _pin):
+		if _pin not in self.callbacks:
+			return None
+		callback, bounce = self.callbacks[_pin]
+		now = time.monotonic()
+		if now - self.lastEdge[_pin] < bounce:
+			return None
+		self.lastEdge[_pin] = now
+		thread = threading.Thread(target=callback, args=(_pin,), daemon=True)
+		thread.start()
+		return thread
 
 
 class SensorService(threading.Thread):
-	def __init__(self, commandInterface, countdown):
+	''' Wakes the mirror on motion. Waits for the sensor to
+		warm up, then arms edge detection on the PIR pin so
+		motion is handled as soon as the pin rises. The falling
+		edge restarts the countdown too, a PIR in retrigger mode
+		stays high for as long as someone keeps moving, and
+		Present() lets the countdown check the pin on expiry.
+	'''
+	def __init__(self, commandInterface, countdown, _pin=PIR_PIN, _warmup=WARMUP,
+			_debounce=DEBOUNCE, _holdoff=HOLDOFF, _gpio=None):
 		threading.Thread.__init__(self)
 		self.daemon = True
-		self.start()
 		self.parent_method = commandInterface
 		self.countdown = countdown
 		self.MirrorSelfStarted = False
+		self.PIN = _pin
+		self.WARMUP = _warmup
+		self.DEBOUNCE = _debounce
+		self.HOLDOFF = _holdoff
+		self.lastMotion = float('-inf')
+		self.lastWakeLatency = None		# seconds from edge to display on
+		self.ready = threading.Event()
+		if _gpio is None:
+			_gpio = GPIO if GPIO is not None else FakeGPIO()
+		self.gpio = _gpio
+		self.gpio.setmode(self.gpio.BCM)
+		self.gpio.setup(self.PIN, self.gpio.IN)
+		self.start()
+
 	def run(self):
-		print('PIR Module Startup script (CTRL+C to exit)')
-		time.sleep(15)
+		print('PIR Module Startup script')
+		time.sleep(self.WARMUP)
+		self.gpio.add_event_detect(self.PIN, self.gpio.BOTH,
+			callback=self.__OnEdge, bouncetime=self.DEBOUNCE)
+		self.ready.set()
 		print("Ready")
-		try:
-			while True:
-				# Screen is off and Movement is sensed
-				if GPIO.input(PIR_PIN) and self.countdown.ReadTimer() <= 0:
-					self.countdown.RestartTimer()
-					self.parent_method("showAll", "") 
-					self.parent_method("guide", "")
-					self.MirrorSelfStarted = True
-				# Screen is on and movement is sensed                 
-				elif GPIO.input(PIR_PIN) and self.countdown.ReadTimer() > 1:
-					self.countdown.RestartTimer()
-				# No movement, Screen on
-				elif self.countdown.ReadTimer() > 1:
-					pass
-				# No movement, countdown at threshold, turning screen off
-				elif self.countdown.ReadTimer() == 1:
-					self.parent_method("hideAll", "")
-					self.MirrorSelfStarted = False
-					print("TimeOut")
-				# Screen is off, no movement, countdown below threshold
-				elif self.countdown.ReadTimer() < 1:
-					pass
-				else:                  
-					pass
-				time.sleep(0.5)
-				
-		except KeyboardInterrupt:
-			print('Quit')
 
+	def Present(self) -> bool:
+		''' True while the PIR output is high '''
+		return self.ready.is_set() and bool(self.gpio.input(self.PIN))
+
+	def __OnEdge(self, _channel):
+		''' Runs on the GPIO callback thread '''
+		if self.gpio.input(self.PIN):
+			self.__OnMotion()
+		elif self.countdown.ReadTimer() > 0:
+			# Motion lasted until now, count down from here
+			self.countdown.RestartTimer()
+
+	def __OnMotion(self):
+		start = time.monotonic()
+		if start - self.lastMotion < self.HOLDOFF:
+			return
+		self.lastMotion = start
+		# Screen is off and Movement is sensed
+		if self.countdown.ReadTimer() <= 0:
+			self.countdown.RestartTimer()
+			self.parent_method("showAll", "")
+			self.parent_method("guide", "")
+			self.MirrorSelfStarted = True
+			self.lastWakeLatency = time.monotonic() - start
+		# Screen is on and movement is sensed
+		else:
+			self.countdown.RestartTimer()
+
+	def Stop(self):
+		self.gpio.remove_event_detect(self.PIN)
+
+
+if __name__ == '__main__':
+	# Times the motion to wake path with the fake driver:
+	# python3 server/PIRBoot.py
+	import sys, os
+	sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+	from timer import Timer
+
+	woken = threading.Event()
+	def command(_name, _data):
+		if _name == "showAll":
+			woken.set()
+
+	gpio = FakeGPIO()
+	countdown = Timer(0.05)
+	service = SensorService(command, countdown, _warmup=0, _holdoff=0, _gpio=gpio)
+	service.ready.wait()
+	latencies = []
+	for i in range(20):
+		woken.clear()
+		start = time.monotonic()
+		gpio.Trigger().join()
+		woken.wait(1)
+		latencies.append(time.monotonic() - start)
+		gpio.Release()
+		time.sleep(DEBOUNCE / 1000)		# Let the bounce window and the screen time out
+	latencies.sort()
+	print("motion to wake: median %.3f ms, max %.3f ms" %
+		(latencies[len(latencies) // 2] * 1000, latencies[-1] * 1000))
@@ -1,35 +1,149 @@
+import threading
 from flask import Flask
 from timer import Timer
+from server.boot import Boot
 import config
 
 #GUI_Control:Interface
 def ChangeGUI(command : str, data):
+	''' Queues a command for the GUI thread, returns a Future
+	or None for unknown commands and while the GUI is starting '''
+	if gui is None:
+		return None
 	if (command == "showAll"):
-		gui.GuiOn()
+		return gui.Post(gui.GuiOn, key="power")
 	elif (command == "hideAll"):
-		gui.GuiOff()
+		return gui.Post(gui.GuiOff, key="power")
 	elif (command == "updateBoard"):
-		gui.UpdateThunderboard(data)
+		return gui.Post(gui.UpdateThunderboard, data, key="updateBoard")
 	elif (command == "notif"):
-		gui.SendNotification(data)
+		return gui.Post(gui.SendNotification, data)
+
+
+# Pushes an edited config.cfg to whatever is running
+def LayoutOperations(layout : dict) -> list:
+	''' BuildGUI.ApplyLayout operations for changed positions and weights '''
+	operations = [('move', name, position) for name, position
+		in layout.get('framePositions', dict()).items()]
+	operations += [('weight', name, weight) for name, weight
+		in layout.get('frameWeights', dict()).items()]
+	return operations
+
+def ReloadConfig(changes : dict):
+	''' Called by the config watcher with the changed settings '''
+	layout = {name: changes.pop(name) for name in config.LIVE_KEYS if name in changes}
+	config.Apply(changes)
+	if 'MirrorTTL' in changes:
+		timer.SetTimeframe(config.MirrorTTL)
+	if 'PIRHoldOff' in changes and motionSensor is not None:
+		motionSensor.HOLDOFF = config.PIRHoldOff
+	if thunderboard is not None:
+		if 'AlertRules' in changes:
+			thunderboard.SetAlertRules(config.AlertRules)
+		if 'BoardRooms' in changes:
+			thunderboard.SetRooms(config.BoardRooms)
+		if 'SamplingPolicies' in changes:
+			thunderboard.SetPolicies(config.SamplingPolicies)
+	with guiLock:
+		if gui is None:
+			# The layout engine may be indexing the positions already,
+			# they go through it once it is there
+			pendingLayout.extend(LayoutOperations(layout))
+			if not pendingLayout:
+				config.Loaded()			# The file holds these, nothing to write back
+		else:
+			if 'AlexaTTL' in changes or 'NotifTTL' in changes:
+				gui.Post(gui.SetTTLs, config.AlexaTTL, config.NotifTTL)
+			operations = LayoutOperations(layout)
+			if operations:
+				gui.Post(gui.ApplyLayout, operations)
+			gui.Post(config.Loaded)		# After the layout, which the file holds already
+	print("Config reloaded: " + ", ".join(sorted(list(changes) + list(layout))))
+	restart = [name for name in ('PIRPin', 'PIRWarmup', 'PIRDebounce', 'FixedLocation')
+		if name in changes]
+	if restart:
+		print("Restart to apply " + ", ".join(restart))
 
 
 # ------------------------------------------------
 # Initialising global dependencies
 # ------------------------------------------------
+config.main()
 flask = Flask(__name__)
-timer = Timer(config.MirrorTTL)
+# Set by the boot stages, None until their stage has started
+timer = None
+gui = None
+guiLock = threading.Lock()	# taken to set gui and to reload the config without it
+pendingLayout = []			# layout reloads waiting for the GUI
+motionSensor = None
+thunderboard = None
+configWatcher = None
 
 # ------------------------------------------------
-# Importing and initializing modules
+# Boot stages, each one starts on its own thread
 # ------------------------------------------------
-import server.interface as interface
-import server.PIRBoot as PIRBoot
-from server.tbscan import ThunderboardHandler
+def StartTimer():
+	global timer
+	# Screen turns off when the countdown runs out
+	timer = Timer(config.MirrorTTL, CountdownExpired)
+	return timer
+
+def CountdownExpired():
+	''' Runs on the timer thread, keeps the screen on while the
+	PIR still sees someone '''
+	if motionSensor is not None and motionSensor.Present():
+		timer.RestartTimer()
+	else:
+		ChangeGUI("hideAll", "")
+
+def StartAPI():
+	from server import views		# registers the endpoints
+
+def StartGUI():
+	global gui
+	import server.interface as interface
+	built = interface.BuildGUI(config.AlexaTTL, config.NotifTTL) # Interface starts
+	with guiLock:
+		gui = built
+		# Reloads while it was being built
+		gui.Post(gui.SetTTLs, config.AlexaTTL, config.NotifTTL)
+		if pendingLayout:
+			gui.Post(gui.ApplyLayout, list(pendingLayout))
+			gui.Post(config.Loaded)
+			pendingLayout.clear()
+	return gui
+
+def StartPIR():
+	global motionSensor
+	import server.PIRBoot as PIRBoot
+	motionSensor = PIRBoot.SensorService(ChangeGUI, timer, config.PIRPin,
+		config.PIRWarmup, config.PIRDebounce, config.PIRHoldOff) # Armed after the warmup
+	return motionSensor
+
+def StartBLE():
+	global thunderboard
+	from server.tbscan import ThunderboardHandler
+	thunderboard = ThunderboardHandler(ChangeGUI, _rooms=config.BoardRooms,
+		_alertRules=config.AlertRules, _present=lambda: timer.ReadTimer() > 0,
+		_policies=config.SamplingPolicies) # Samples slowly while the mirror is dark
+	return thunderboard
 
-motionSensor = PIRBoot.SensorService(ChangeGUI, timer) # MotionSensor starts after 15 seconds
-gui = interface.BuildGUI(config.AlexaTTL, config.NotifTTL) # Interface starts
-thunderboard = ThunderboardHandler(ChangeGUI)
+def StartConfigWatcher():
+	global configWatcher
+	from server.configwatch import ConfigWatcher
+	configWatcher = ConfigWatcher(ReloadConfig)
+	return configWatcher
 
-from server import views
-# Appflow goes back to run.py
+# Commands sent before the GUI exists are dropped by ChangeGUI,
+# so nothing waits for it
+boot = Boot()
+boot.Add('timer', StartTimer)
+boot.Add('gui', StartGUI, _ready=lambda gui: gui.ready.wait())			# mainloop running
+boot.Add('api', StartAPI, _after=('timer',))		# endpoints restart the countdown
+boot.Add('config', StartConfigWatcher, _after=('timer',))	# reloads change its timeframe
+boot.Add('pir', StartPIR, _after=('timer',),
+	_ready=lambda sensor: sensor.ready.wait())		# sensor warmed up
+boot.Add('ble', StartBLE, _after=('timer',),
+	_ready=lambda handler: handler.ready.wait())	# first reading
+boot.Start()
+# Appflow goes back to run.py, which serves the API once its stage is done
@@ -0,0 +1,198 @@
+#!/usr/bin/python3
+import time
+from bisect import bisect_left, bisect_right, insort
+
+MIN_GAP = 10		# seconds between any two alerts
+RULE_KEYS = ('name', 'metric', 'message', 'above', 'below', 'hysteresis',
+	'cooldown', 'severity', 'clear')
+INF = float('inf')
+
+
+class Rule():
+	''' One compiled alert rule. Active once the metric crosses the
+		threshold, inactive again only after it moves back past the
+		threshold by the hysteresis. While active it notifies again
+		every cooldown seconds, 0 means only once. Below rules are
+		kept as above rules on the negated value, sign * value
+		triggers at trigger and clears under clearAt. '''
+	def __init__(self, name, metric, message, above=None, below=None,
+			hysteresis=0.0, cooldown=0.0, severity=1, clear=''):
+		if (above is None) == (below is None):
+			raise ValueError("Rule " + name + " needs exactly one of above or below")
+		self.name = name
+		self.metric = metric
+		self.message = message
+		self.clear = clear
+		self.severity = int(severity)
+		self.cooldown = float(cooldown)
+		hysteresis = float(hysteresis)
+		if above is not None:
+			self.sign = 1
+			self.trigger = float(above)
+		else:
+			self.sign = -1
+			self.trigger = -float(below)
+		self.clearAt = self.trigger - hysteresis
+		# State
+		self.active = False
+		self.lastNotified = float('-inf')
+
+
+class MetricRules():
+	''' The rules of one metric indexed by threshold. A new value
+		only visits the rules whose trigger or clear point lies
+		between it and the previous value, and the most severe
+		active rule is the first of a sorted list. Above rules
+		follow the highest value of the metric, below rules the
+		lowest. '''
+	def __init__(self, _rules):
+		self.rules = _rules
+		self.values = {1: None, -1: None}	# sign -> last value evaluated
+		self.triggers = {1: [], -1: []}		# sign -> sorted [(point, index)]
+		self.clears = {1: [], -1: []}
+		for i, rule in enumerate(_rules):
+			self.triggers[rule.sign].append((rule.trigger, i))
+			self.clears[rule.sign].append((rule.clearAt, i))
+		for points in list(self.triggers.values()) + list(self.clears.values()):
+			points.sort()
+		self.active = []			# [(-severity, index)], most severe first
+		self.alerted = False		# notified since the metric was last normal
+
+	def Changed(self, _high, _low) -> bool:
+		return self.values[1] != _high or self.values[-1] != _low
+
+	def Move(self, _high, _low) -> list:
+		''' Updates the rule states for the highest and lowest value,
+		returns the rules that cleared. Every rule triggered by the
+		previous value is active and every rule cleared by it
+		inactive, so only the points crossed since can change
+		anything. '''
+		cleared = []
+		for sign, current in ((1, _high), (-1, _low)):
+			value = sign * current
+			last = None if self.values[sign] is None else sign * self.values[sign]
+			if last is None or value > last:
+				points = self.triggers[sign]
+				start = 0 if last is None else bisect_right(points, (last, INF))
+				for point, i in points[start:bisect_right(points, (value, INF))]:
+					if not self.rules[i].active:
+						self.rules[i].active = True
+						insort(self.active, (-self.rules[i].severity, i))
+			elif value < last:
+				points = self.clears[sign]
+				for point, i in points[bisect_right(points, (value, INF)):
+						bisect_right(points, (last, INF))]:
+					rule = self.rules[i]
+					if rule.active:
+						rule.active = False
+						rule.lastNotified = float('-inf')
+						del self.active[bisect_left(self.active, (-rule.severity, i))]
+						cleared.append(rule)
+			self.values[sign] = current
+		return cleared
+
+	def Top(self):
+		''' The most severe active rule, None if there is none '''
+		return self.rules[self.active[0][1]] if self.active else None
+
+
+class AlertEngine():
+	''' Evaluates every rule against a reading in one pass.
+		Rules are indexed by metric and threshold. Metrics whose
+		value didn't change are skipped unless a repeat is due, and
+		a changed value only visits the thresholds it crossed, so
+		the cost of a pass depends on how far the values moved,
+		not on how many rules exist. Of the active rules of a
+		metric only the most severe one notifies. '''
+	def __init__(self, _rules, _notify, _minGap=MIN_GAP):
+		''' _rules are dicts of Rule arguments, _notify(rule, message)
+		is called for every alert and every clear message. Invalid
+		rules are reported and left out. '''
+		self.notify = _notify
+		self.minGap = _minGap
+		self.lastAlert = float('-inf')
+		byMetric = dict()
+		for options in _rules:
+			try:
+				rule = Rule(**options)
+			except (TypeError, ValueError) as e:
+				print("Alert rule " + str(options.get('name')) + " skipped: " + str(e))
+				continue
+			byMetric.setdefault(rule.metric, []).append(rule)
+		self.byMetric = {metric: MetricRules(rules) for metric, rules in byMetric.items()}
+		self.repeatsDue = dict()	# metric -> monotonic time a repeat is due
+
+	def Evaluate(self, _reading: dict, _now=None, _low=None) -> int:
+		''' Checks the reading, returns the number of notifications.
+		_low holds the lowest values for below rules, when the
+		reading combines several rooms, by default the reading. '''
+		now = time.monotonic() if _now is None else _now
+		low = _reading if _low is None else _low
+		sent = 0
+		for metric, value in _reading.items():
+			rules = self.byMetric.get(metric)
+			lowest = low.get(metric, value)
+			if rules is None or not isinstance(value, (int, float)) or \
+					not isinstance(lowest, (int, float)):
+				continue
+			if not rules.Changed(value, lowest) and self.repeatsDue.get(metric, INF) > now:
+				continue
+			sent += self.__EvaluateMetric(metric, rules, value, lowest, now)
+		return sent
+
+	def __EvaluateMetric(self, _metric, _rules, _high, _low, _now) -> int:
+		sent = 0
+		# One clear message, from the mildest rule that has one, if
+		# the metric alerted at any level since it was last normal
+		clears = [rule for rule in _rules.Move(_high, _low) if rule.clear]
+		if clears and _rules.alerted:
+			rule = min(clears, key=lambda rule: rule.severity)
+			self.notify(rule, rule.clear)
+			sent += 1
+		rule = _rules.Top()
+		if rule is None:
+			_rules.alerted = False
+			self.repeatsDue[_metric] = INF
+			return sent
+		due = rule.lastNotified == float('-inf') or \
+			(rule.cooldown > 0 and _now - rule.lastNotified >= rule.cooldown)
+		if due and _now - self.lastAlert >= self.minGap:
+			self.notify(rule, rule.message)
+			self.lastAlert = _now
+			rule.lastNotified = _now
+			_rules.alerted = True
+			sent += 1
+		if rule.lastNotified == float('-inf'):		# held back by the gap
+			self.repeatsDue[_metric] = self.lastAlert + self.minGap
+		elif rule.cooldown > 0:
+			self.repeatsDue[_metric] = rule.lastNotified + rule.cooldown
+		else:
+			self.repeatsDue[_metric] = INF
+		return sent
+
+
+if __name__ == '__main__':
+	# Evaluation cost as rules are added: python3 server/alerts.py
+	# All rules watch the board's own metrics, whose values drift
+	# the way real readings do.
+	import random
+	METRICS = ('temperature', 'humidity', 'ambientLight', 'uvIndex',
+		'co2', 'voc', 'sound', 'pressure')
+	value = {metric: 1500.0 for metric in METRICS}
+	readings = []
+	for i in range(1000):
+		value = {metric: min(max(current + random.gauss(0, 5), 0), 3000)
+			for metric, current in value.items()}
+		readings.append(value)
+	print("%8s %14s" % ("rules", "us per pass"))
+	for count in (8, 80, 800, 8000):
+		rules = [{'name': 'rule%d' % i, 'metric': METRICS[i % len(METRICS)],
+			'above': random.uniform(0, 3000), 'hysteresis': 10,
+			'cooldown': 60, 'message': 'alert %d' % i} for i in range(count)]
+		engine = AlertEngine(rules, lambda rule, message: None, 0)
+		engine.Evaluate(readings[0], 0)		# first pass visits every rule
+		start = time.perf_counter()
+		for step, reading in enumerate(readings[1:]):
+			engine.Evaluate(reading, step + 1)
+		elapsed = time.perf_counter() - start
+		print("%8d %14.2f" % (count, elapsed / (len(readings) - 1) * 1e6))
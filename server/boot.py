@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+import time
+import threading
+from collections import OrderedDict
+from traceback import print_exc
+
+
+class Stage():
+	''' One step of the boot. _start() builds the subsystem and
+		_ready(result), if given, blocks until it is actually usable,
+		like a sensor warming up or a mainloop starting.
+	'''
+	def __init__(self, _name: str, _start, _after=(), _ready=None):
+		self.name = _name
+		self.start = _start
+		self.after = tuple(_after)
+		self.ready = _ready
+		self.result = None
+		self.error = None
+		self.state = 'waiting'		# waiting, starting, started, ready, failed, skipped
+		self.done = threading.Event()	# set once started or given up on
+		self.times = {'started': None, 'done': None, 'ready': None}
+
+
+class Boot():
+	''' Starts every stage on its own thread as soon as the stages
+		it comes after are done, so independent subsystems come up
+		in parallel. Keeps a timeline of when each stage started,
+		finished and became ready, in seconds since Boot().
+	'''
+	def __init__(self):
+		self.created = time.monotonic()
+		self.lock = threading.Lock()
+		self.stages = OrderedDict()		# name -> Stage, in the order added
+
+	def Add(self, _name: str, _start, _after=(), _ready=None):
+		for name in _after:
+			if name not in self.stages:
+				raise ValueError("Stage " + _name + " comes after unknown stage " + name)
+		self.stages[_name] = Stage(_name, _start, _after, _ready)
+
+	def Start(self):
+		for stage in self.stages.values():
+			threading.Thread(target=self.__Run, args=(stage,), daemon=True,
+				name='boot-' + stage.name).start()
+
+	def Wait(self, _name: str, _timeout=None):
+		''' Result of the stage once it is done, None if it failed '''
+		stage = self.stages[_name]
+		stage.done.wait(_timeout)
+		return stage.result
+
+	def Timeline(self) -> list:
+		''' Stages in the order they started, times in seconds '''
+		with self.lock:
+			timeline = [{'name': stage.name, 'after': list(stage.after),
+				'state': stage.state, 'error': stage.error,
+				'started': stage.times['started'], 'done': stage.times['done'],
+				'ready': stage.times['ready'],
+				'seconds': None if stage.times['done'] is None else
+					round(stage.times['done'] - stage.times['started'], 3)}
+				for stage in self.stages.values()]
+		return sorted(timeline, key=lambda entry: (entry['started'] is None,
+			entry['started'] or 0))
+
+	def __Mark(self, _stage, _event: str, _state: str):
+		with self.lock:
+			_stage.times[_event] = round(time.monotonic() - self.created, 3)
+			_stage.state = _state
+		print("Boot: %s %s at %.3f s" % (_stage.name, _state, _stage.times[_event]))
+
+	def __Run(self, _stage):
+		for name in _stage.after:
+			self.stages[name].done.wait()
+			if self.stages[name].state in ('failed', 'skipped'):
+				with self.lock:
+					_stage.state = 'skipped'
+					_stage.error = name + " did not start"
+				_stage.done.set()
+				return
+		self.__Mark(_stage, 'started', 'starting')
+		try:
+			_stage.result = _stage.start()
+		except Exception as e:
+			print_exc()
+			_stage.error = str(e)
+			self.__Mark(_stage, 'done', 'failed')
+			_stage.done.set()
+			return
+		self.__Mark(_stage, 'done', 'started')
+		_stage.done.set()
+		if _stage.ready is not None:
+			_stage.ready(_stage.result)
+		self.__Mark(_stage, 'ready', 'ready')
@@ -0,0 +1,97 @@
+#!/usr/bin/python3
+import os
+import time
+import threading
+import configparser
+import config
+
+try:
+	from inotify_simple import INotify, flags
+except ImportError:			# Polls the file instead
+	INotify = None
+
+POLL_INTERVAL = 2			# seconds, without inotify
+
+
+class ConfigWatcher(threading.Thread):
+	''' Watches the config file and hands the settings that changed
+		to _onChange(changes), see config.Diff. Uses inotify on the
+		file's folder, editors often replace the file instead of
+		writing it, and falls back to polling its size and mtime.
+		A file that doesn't parse is reported and ignored.
+	'''
+	def __init__(self, _onChange, _path=None, _pollInterval=POLL_INTERVAL):
+		self.onChange = _onChange
+		self.path = os.path.abspath(_path or config.confFile)
+		self.pollInterval = _pollInterval
+		self.text = self.__Read()			# contents the settings came from
+		self.reloads = 0
+		self.rejected = 0
+		threading.Thread.__init__(self)
+		self.daemon = True
+		self.start()
+
+	def run(self):
+		if INotify is not None:
+			try:
+				self.__Watch()
+				return
+			except OSError as e:		# Out of watches or no inotify
+				print("Config watch falling back to polling: " + str(e))
+		self.__Poll()
+
+	def Check(self) -> dict:
+		''' Reparses the file if its contents changed to something
+		the mirror didn't write itself, returns the changes handed
+		on '''
+		text = self.__Read()
+		if text is None or text == self.text:
+			return dict()
+		self.text = text
+		if text == config.written:
+			return dict()		# the mirror's own write, its settings are current
+		try:
+			changes = config.Diff(config.Parse(text))
+		except (ValueError, KeyError, configparser.Error) as e:
+			self.rejected += 1
+			print("Config not reloaded: " + str(e))
+			return dict()
+		# Sections config.py doesn't know are written back as this
+		# file has them, also when it didn't load at boot
+		kept = configparser.ConfigParser()
+		kept.read_string(text)
+		with config.settingsLock:
+			config.config = kept
+		if changes or config.loadFailed:
+			self.reloads += 1
+			self.onChange(changes)
+		return changes
+
+	def __Read(self):
+		try:
+			with open(self.path) as configfile:
+				return configfile.read()
+		except OSError:
+			return None
+
+	def __Watch(self):
+		inotify = INotify()
+		inotify.add_watch(os.path.dirname(self.path),
+			flags.CLOSE_WRITE | flags.MOVED_TO | flags.CREATE)
+		name = os.path.basename(self.path)
+		while True:
+			if any(event.name == name for event in inotify.read()):
+				self.Check()
+
+	def __Poll(self):
+		stamp = None
+		while True:
+			try:
+				status = os.stat(self.path)
+				current = (status.st_mtime_ns, status.st_size)
+			except OSError:
+				current = None
+			if current != stamp:
+				stamp = current
+				self.Check()
+			time.sleep(self.pollInterval)
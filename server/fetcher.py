@@ -0,0 +1,47 @@
+#!/usr/bin/python3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from traceback import print_exc
+
+WORKERS = 2
+
+
+class Fetcher():
+	''' Runs network fetches on a small worker pool so the Tk
+		mainloop never waits on the network. Results are handed
+		back to the Tk thread through the GUI command queue.
+	'''
+	def __init__(self, _post, _workers=WORKERS):
+		''' _post is BuildGUI.Post or anything with its signature '''
+		self.post = _post
+		self.executor = ThreadPoolExecutor(max_workers=_workers,
+			thread_name_prefix='fetch')
+		self.lock = threading.Lock()
+		self.inFlight = set()
+
+	def Submit(self, _name: str, _fetch, _onResult, _onSuccess=None) -> bool:
+		''' Runs _fetch() on a worker, then _onResult(result) on the
+		Tk thread. Skipped when _name is still being fetched or the
+		fetch fails or returns None. _onSuccess() is called on the
+		worker when the fetch didn't fail, also for None. '''
+		with self.lock:
+			if _name in self.inFlight:
+				return False
+			self.inFlight.add(_name)
+		self.executor.submit(self.__Run, _name, _fetch, _onResult, _onSuccess)
+		return True
+
+	def __Run(self, _name, _fetch, _onResult, _onSuccess):
+		try:
+			result = _fetch()
+			if _onSuccess is not None:
+				_onSuccess()
+		except Exception as exc:
+			print_exc()
+			print("Error %s. Fetching %s failed." % (exc, _name))
+			result = None
+		finally:
+			with self.lock:
+				self.inFlight.discard(_name)
+		if result is not None:
+			self.post(_onResult, result, key=('fetch', _name))
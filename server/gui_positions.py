@@ -38,7 +38,7 @@ def PositionResolver( _config: str) -> Position:
 	elif _config == str(Pos.MIDLEFT.name):
 		return Pos.MIDLEFT
 	elif _config == str(Pos.MIDMID.name):
-		return Pos.MID
+		return Pos.MIDMID
 	elif _config == str(Pos.MIDRIGHT.name):
 		return Pos.MIDRIGHT
 	elif _config == str(Pos.BOTLEFT.name):
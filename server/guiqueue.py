@@ -0,0 +1,104 @@
+#!/usr/bin/python3
+import os
+import threading
+import itertools
+from collections import OrderedDict
+from concurrent.futures import Future
+from traceback import print_exc
+import tkinter
+from server.lifecycle import wakeups
+
+FRAME_MS = 40		# commands arriving within one frame are applied together
+POLL_MS = 100		# used only where Tk can't watch a pipe
+
+
+class CommandQueue():
+	''' Hands GUI commands from Flask, BLE and sensor threads
+		to the Tk thread. Commands posted with the same key
+		replace each other until the Tk thread applies them, so
+		a burst of snapshots or toggles costs one apply per frame.
+		Commands run in the order they were first posted in, keys
+		name one kind of change to one thing, like ('visible', name).
+	'''
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.pending = OrderedDict()		# key -> (function, args, futures)
+		self.sequence = itertools.count()	# keys for commands that never coalesce
+		self.root = None
+		self.signalled = False
+		self.scheduled = False
+		self.readPipe, self.writePipe = os.pipe()
+		# Counters
+		self.posted = 0
+		self.coalesced = 0
+		self.applied = 0
+
+	def Attach(self, _root):
+		''' Starts draining on the Tk thread, call from it. '''
+		self.root = _root
+		try:
+			_root.tk.createfilehandler(self.readPipe, tkinter.READABLE, self.__OnWake)
+		except (AttributeError, RuntimeError):	# No file handlers on this platform
+			self.__Poll()
+			return
+		with self.lock:
+			if self.pending:
+				self.__Signal()
+
+	def Post(self, _function, *args, key=None) -> Future:
+		''' Queues _function(*args) for the Tk thread. Returns a
+			Future resolved with the function's return value. '''
+		future = Future()
+		with self.lock:
+			self.posted += 1
+			if key is None:
+				key = next(self.sequence)
+			elif key in self.pending:
+				# Superseded, the newer command answers for both and
+				# runs where the first one was queued
+				futures = self.pending[key][2]
+				futures.append(future)
+				self.pending[key] = (_function, args, futures)
+				self.coalesced += 1
+				return future
+			self.pending[key] = (_function, args, [future])
+			if self.root is not None:
+				self.__Signal()
+		return future
+
+	def Drain(self) -> int:
+		''' Applies everything queued, runs on the Tk thread '''
+		wakeups.Count('commands')
+		with self.lock:
+			batch = self.pending
+			self.pending = OrderedDict()
+			self.signalled = False
+			self.scheduled = False
+		for function, args, futures in batch.values():
+			try:
+				result = function(*args)
+			except Exception as e:
+				print_exc()
+				for future in futures:
+					future.set_exception(e)
+			else:
+				for future in futures:
+					future.set_result(result)
+		self.applied += len(batch)
+		return len(batch)
+
+	def __Signal(self):
+		''' Wakes the Tk thread once per batch, lock must be held '''
+		if not self.signalled:
+			self.signalled = True
+			os.write(self.writePipe, b'!')
+
+	def __OnWake(self, _fd, _mask):
+		os.read(self.readPipe, 512)
+		if not self.scheduled:
+			self.scheduled = True
+			self.root.after(FRAME_MS, self.Drain)
+
+	def __Poll(self):
+		self.Drain()
+		self.root.after(POLL_MS, self.__Poll)
@@ -0,0 +1,72 @@
+#!/usr/bin/python3
+import time
+import threading
+from requests import Session
+from requests.adapters import HTTPAdapter
+
+POOL_SIZE = 4		# kept alive connections per host
+TIMEOUT = 10		# seconds
+
+
+class HttpClient():
+	''' One keep-alive session shared by every upstream source.
+		Conditional requests send back the ETag and Last-Modified
+		of the previous answer, Get returns None on 304 so callers
+		can skip parsing and redrawing.
+	'''
+	def __init__(self, _poolSize=POOL_SIZE, _timeout=TIMEOUT):
+		self.timeout = _timeout
+		self.session = Session()
+		adapter = HTTPAdapter(pool_connections=_poolSize, pool_maxsize=_poolSize)
+		self.session.mount('http://', adapter)
+		self.session.mount('https://', adapter)
+		self.lock = threading.Lock()
+		self.validators = dict()	# url -> request headers for the next conditional GET
+		self.stats = dict()			# source -> counters
+
+	def Get(self, _source: str, _url: str, _conditional=False):
+		''' Fetches _url, counting it against _source.
+		Returns the response, or None when the server answered
+		304 Not Modified. Raises on connection errors and 4xx/5xx. '''
+		headers = dict()
+		if _conditional:
+			with self.lock:
+				headers.update(self.validators.get(_url, {}))
+		start = time.monotonic()
+		response = self.session.get(_url, headers=headers, timeout=self.timeout)
+		elapsed = time.monotonic() - start
+		notModified = response.status_code == 304
+		self.__Count(_source, len(response.content), elapsed, notModified)
+		if notModified:
+			return None
+		response.raise_for_status()
+		if _conditional:
+			validators = dict()
+			if 'ETag' in response.headers:
+				validators['If-None-Match'] = response.headers['ETag']
+			if 'Last-Modified' in response.headers:
+				validators['If-Modified-Since'] = response.headers['Last-Modified']
+			with self.lock:
+				self.validators[_url] = validators
+		return response
+
+	def Stats(self) -> dict:
+		''' Copy of the per source counters '''
+		with self.lock:
+			return {source: dict(counters) for source, counters in self.stats.items()}
+
+	def __Count(self, _source, _bytes, _elapsed, _notModified):
+		with self.lock:
+			counters = self.stats.setdefault(_source, {
+				'requests': 0, 'notModified': 0, 'bytes': 0,
+				'totalSeconds': 0.0, 'lastSeconds': 0.0})
+			counters['requests'] += 1
+			counters['bytes'] += _bytes
+			counters['totalSeconds'] += _elapsed
+			counters['lastSeconds'] = _elapsed
+			if _notModified:
+				counters['notModified'] += 1
+
+
+# Shared by all widgets
+client = HttpClient()
@@ -0,0 +1,68 @@
+#!/usr/bin/python3
+import os
+import threading
+import PIL.Image, PIL.ImageTk
+from traceback import print_exc
+
+ICON_SIZE = (100, 100)
+SCALED_DIR = "icons/.scaled/"		# pre-scaled copies, safe to delete
+
+
+class IconAtlas():
+	''' Weather icons decoded and scaled to the display size once.
+		Scaled images are memoized and saved next to the originals,
+		Tk images are made once per icon on the Tk thread. After
+		that an icon swap is a dictionary lookup.
+	'''
+	def __init__(self, _paths, _size=ICON_SIZE, _scaledDir=SCALED_DIR):
+		self.paths = sorted(set(_paths))
+		self.size = _size
+		self.scaledDir = os.path.join(_scaledDir, "%dx%d" % _size)
+		self.lock = threading.Lock()
+		self.images = dict()		# path -> scaled PIL image, any thread
+		self.photos = dict()		# path -> PhotoImage, Tk thread only
+
+	def Preload(self):
+		''' Scales every icon, meant for a worker thread '''
+		for path in self.paths:
+			try:
+				self.Image(path)
+			except OSError:
+				print_exc()
+
+	def Image(self, _path: str):
+		''' Scaled RGB image for _path '''
+		with self.lock:
+			image = self.images.get(_path)
+		if image is not None:
+			return image
+		scaled = os.path.join(self.scaledDir, os.path.basename(_path))
+		if os.path.exists(scaled) and \
+				os.path.getmtime(scaled) >= os.path.getmtime(_path):
+			image = PIL.Image.open(scaled)
+			image.load()
+		else:
+			image = PIL.Image.open(_path)
+			image = image.resize(self.size, PIL.Image.LANCZOS)
+			image = image.convert('RGB')
+			self.__Save(image, scaled)
+		with self.lock:
+			self.images[_path] = image
+		return image
+
+	def Photo(self, _path: str):
+		''' Tk image for _path, call from the Tk thread '''
+		photo = self.photos.get(_path)
+		if photo is None:
+			photo = PIL.ImageTk.PhotoImage(self.Image(_path))
+			self.photos[_path] = photo
+		return photo
+
+	def __Save(self, _image, _scaled):
+		try:
+			os.makedirs(self.scaledDir, exist_ok=True)
+			tmpFile = _scaled + '.tmp'
+			_image.save(tmpFile, 'PNG')
+			os.replace(tmpFile, _scaled)
+		except OSError:		# Read only install, keep it in memory only
+			print_exc()
@@ -8,18 +8,26 @@ from traceback import print_exc			# installed modules
 from json import loads
 from time import strftime
 import time
-from datetime import datetime, timedelta
+from datetime import datetime
 from threading import Lock
 import locale
+import math
+import re
 import threading
-import pathlib
 from contextlib import contextmanager
-from requests import get
 from feedparser import parse
-import PIL.Image, PIL.ImageTk
 from tkinter import *					# Recommended way for tkinter
 
 from server.gui_positions import Pos	# custom modules
+from server.guiqueue import CommandQueue
+from server.fetcher import Fetcher
+from server.httpclient import client
+from server.snapshot import cache
+from server.location import LocationResolver
+from server.icons import IconAtlas
+from server.lifecycle import LazyFrame, Refresher, wakeups
+from server.layout import Layout
+from server.notifications import NotificationScheduler
 import config as cfg
 
 # --------------------------------------------------------
@@ -39,11 +47,13 @@ LOCATION_API_TOKEN = '66c1f2e2627bb5299404ddfbe5ff5185'
 WEATHER_LANG = 'en'
 WEATHER_UNIT = 'uk2'
 ICON_DIR = "icons/"
+WEATHER_REFRESH = 300								# seconds, only while shown
+NEWS_REFRESH = 300
 
 ICON_LOOKUP = {
 	'clear-day': ICON_DIR + "sun.png",  			# Clear Sky
 	'wind': ICON_DIR + "wind.png", 					# Wind
-	'cloudy': ICON_DIR + "cloud.png",  				# Cloudy day
+	'cloudy': ICON_DIR + "clouds.png",  				# Cloudy day
 	'partly-cloudy-day': ICON_DIR + "sun-cloud.png",# Partial clouds
 	'rain': ICON_DIR + "rain.png",  				# Rain
 	'snow': ICON_DIR + "snow.png",  				# Snow
@@ -68,6 +78,20 @@ MD_TEXT = 28
 SM_TEXT = 18
 XS_TEXT = 12
 
+
+def WarmStart(_name: str, _show):
+	''' Shows the snapshot of _name with _show(data) if there is
+	one. An entry the widget can't show is reported and skipped,
+	the widget waits for fresh data instead. '''
+	data = cache.Get(_name)
+	if data is None:
+		return
+	try:
+		_show(data)
+	except Exception:
+		print_exc()
+		print("Cached " + _name + " skipped")
+
 @contextmanager
 def setlocale(name):
 	"""	used to set the locale using system locale for 
@@ -79,6 +103,63 @@ def setlocale(name):
 		finally:
 			locale.setlocale(locale.LC_ALL, saved)
 
+class LocaleTables():
+	"""	Day, month and AM/PM names of a locale, read once so
+	formatting the clock never switches the process locale. """
+	DIRECTIVE = re.compile('%(.)')
+
+	def __init__(self, name):
+		try:
+			with setlocale(name):
+				self.__Read()
+		except locale.Error:
+			print("Locale %s not installed, using the default." % name)
+			self.__Read()
+
+	def __Read(self):
+		# 2018-01-01 was a Monday, tm_wday 0
+		days = [(2018, 1, 1 + i, 12, 0, 0, i, 1 + i, 0) for i in range(7)]
+		months = [(2018, 1 + i, 1, 12, 0, 0, 0, 1, 0) for i in range(12)]
+		self.days = [strftime('%A', day) for day in days]
+		self.shortDays = [strftime('%a', day) for day in days]
+		self.months = [strftime('%B', month) for month in months]
+		self.shortMonths = [strftime('%b', month) for month in months]
+		self.ampm = [strftime('%p', (2018, 1, 1, hour, 0, 0, 0, 1, 0)) for hour in (0, 12)]
+
+	def Compile(self, _format: str):
+		"""	Turns a strftime format into a function of a datetime
+		that looks names up in the tables. """
+		fields = {
+			'A': lambda t: self.days[t.weekday()],
+			'a': lambda t: self.shortDays[t.weekday()],
+			'B': lambda t: self.months[t.month - 1],
+			'b': lambda t: self.shortMonths[t.month - 1],
+			'p': lambda t: self.ampm[t.hour >= 12],
+			'd': lambda t: '%02d' % t.day,
+			'm': lambda t: '%02d' % t.month,
+			'Y': lambda t: '%d' % t.year,
+			'y': lambda t: '%02d' % (t.year % 100),
+			'H': lambda t: '%02d' % t.hour,
+			'I': lambda t: '%02d' % ((t.hour - 1) % 12 + 1),
+			'M': lambda t: '%02d' % t.minute,
+			'%': lambda t: '%'
+		}
+		parts = []
+		for index, piece in enumerate(self.DIRECTIVE.split(_format)):
+			if index % 2 == 0:					# literal text
+				if piece:
+					parts.append(lambda t, text=piece: text)
+			elif piece in fields:
+				parts.append(fields[piece])
+			else:								# not locale dependent
+				parts.append(lambda t, code='%' + piece: t.strftime(code))
+		return lambda t: ''.join(part(t) for part in parts)
+
+CLOCK_LOCALE = LocaleTables(UI_LOCALE)
+CLOCK_TIME = CLOCK_LOCALE.Compile('%I:%M %p' if TIME_FORMAT == 12 else '%H:%M')
+CLOCK_DAY = CLOCK_LOCALE.Compile('%A')
+CLOCK_DATE = CLOCK_LOCALE.Compile(DATE_FORMAT)
+
 # --------------------------------------------------------
 # Widgets
 # --------------------------------------------------------
@@ -86,14 +167,15 @@ class Weather(Frame):
 	"""	This class contains methods that fetch weather information.
 	Weather information is based upon location.
 	Location is determined using the device's IP address. """
-	def __init__(self, parent):
+	def __init__(self, parent, fetcher):
 		"""Constructor, Stores weather information."""
 		Frame.__init__(self, parent, bg='black')
+		self.fetcher = fetcher
 		self.temperature = ''										# data storage variables
 		self.forecast = ''
 		self.location = ''
-		self.latitude = ''
-		self.longitude = ''
+		self.resolver = LocationResolver(LOCATION_API_TOKEN, cfg.FixedLocation)
+		self.icons = IconAtlas(ICON_LOOKUP.values())
 		self.currently = ''
 		self.icon = ''
 		
@@ -114,94 +196,78 @@ class Weather(Frame):
 			fg="white", bg="black")
 		self.location_label.pack(side=TOP, anchor=W)
 
-		self.get_location()											#running methods
-		self.get_weather()
-
-
-	def get_location(self):
-		"""	Method to fetch device location based upon IP address. """
-		try:
-			### Fetch location using freegeoip API ###
-			# store location URL. Uses IP fetched by get_ip() in variable
-			location_req_url = ("http://api.ipstack.com/" + str(self.get_ip()) +
-								"?access_key=" + LOCATION_API_TOKEN + "&output=json&legacy=1")
-			req = get(location_req_url)							# fetch data from URL
-			location_obj = loads(req.text)						# convert fetched data to object
-			if self.latitude != location_obj['latitude']:		# change latitude variable if device has moved.
-				self.latitude = location_obj['latitude']
-			if self.longitude != location_obj['longitude']:		# change latitude variable if device has moved.
-				self.longitude = location_obj['longitude']
-			location_tmp = "%s, %s" % \
-					(location_obj['city'], location_obj['region_code']) # get current location and store in tmp variable
-			if self.location != location_tmp:					# update weather information
-				self.location = location_tmp
-				self.location_label.config(text=location_tmp)
-		except Exception as exc:
-			print_exc()
-			return "Error: %s. Cannot get location." % exc
-
-	def get_weather(self):
-		"""	Method that fetches weather information """
-		try:
-			### Get weather information using Darksky API ###
-			# store the darksky API URL in variable
-			weather_req_url =\
-				"https://api.darksky.net/forecast/%s/%s,%s?lang=%s&units=%s" \
-				% (WEATHER_API_TOKEN, self.latitude, self.longitude,\
-				   WEATHER_LANG, WEATHER_UNIT)
-			req = get(weather_req_url) 								# fetch data from URL
-			weather_obj = loads(req.text) 							# convert fetched data to object
-			### Assign weather information to variables ###
-			degree_sign = u'\N{DEGREE SIGN}'
-			temperature_tmp = "%s%s" % \
-					(str(int(weather_obj['currently']['temperature'])), \
-					 degree_sign)									# Current temperature
-			currently_tmp = weather_obj['currently']['summary'] 	# Current Weather
-			forecast_tmp = weather_obj['hourly']['summary']			# Frorecast
-			icon_id = weather_obj['currently']['icon']				# Weather icon id
-			icon_tmp = None
-			if icon_id in ICON_LOOKUP:								# weather icon lookup
-				icon_tmp = ICON_LOOKUP[icon_id]
-
-			if icon_tmp is not None:
-				if self.icon != icon_tmp:														
-					self.icon = icon_tmp							# set self.icon to the new icon
-					image = PIL.Image.open(pathlib.Path(icon_tmp))	# open the image file
-					image = image.resize((100, 100), PIL.Image.ANTIALIAS)# resize the image and antialias
-					image = image.convert('RGB')
-					photo = PIL.ImageTk.PhotoImage(image)			# convert image to tkinter object and store in variable
-					self.icon_label.config(image=photo)				# apply settings to self.icon_label
-					self.icon_label.image = photo
-			else:	# remove image
-				self.icon_label.config(image='')
-			if self.currently != currently_tmp:						# update all weather information
-				self.currently = currently_tmp
-				self.currently_label.config(text=currently_tmp)
-			if self.forecast != forecast_tmp:
-				self.forecast = forecast_tmp
-				self.forecast_label.config(text=forecast_tmp)
-			if self.temperature != temperature_tmp:
-				self.temperature = temperature_tmp
-				self.temperature_label.config(text=temperature_tmp)
-		except Exception as exc:
-			print_exc()
-			print("Error %s. Cannot get weather." % exc)
-		self.after(300000, self.get_weather)
-
-
-	@staticmethod
-	def get_ip():
-		"""	gets the IP address of the device and returns it """
-		try:
-			### Fetch IP address using IPify API ###
-			# store ipify API URL in variable
-			ip_url = "https://api.ipify.org?format=json"
-			req = get(ip_url)							# fetch data from URL
-			ip_obj = loads(req.text)					# convert fetched data to object
-			return ip_obj['ip']							# return value
-		except Exception as exc:
-			print_exc()
-			return "Error: %s. Cannot get IP." % exc
+		self.fetcher.Submit('icons', self.icons.Preload, None)		# decode and scale once
+		WarmStart('weather', self.ShowWeather)
+		self.refresher = Refresher(self, cfg.WEATHER_NAME, WEATHER_REFRESH, self.Refresh)
+		self.refresher.Now()										# ready for the first show
+
+
+	def Resume(self):
+		"""	Shown, refreshes at once if the weather is stale """
+		self.refresher.Resume()
+
+	def Pause(self):
+		self.refresher.Pause()
+
+	def Refresh(self):
+		"""	Starts a background fetch, results arrive in ShowWeather """
+		self.fetcher.Submit(cfg.WEATHER_NAME, self.FetchWeather, self.ShowWeather,
+			self.refresher.Done)
+
+	def FetchWeather(self) -> dict:
+		"""	Runs on a fetch worker. Resolves the location, then
+		fetches the weather for it. Returns None when the
+		forecast hasn't changed. """
+		latitude, longitude, location = self.resolver.Resolve()
+		### Get weather information using Darksky API ###
+		# store the darksky API URL in variable
+		weather_req_url =\
+			"https://api.darksky.net/forecast/%s/%s,%s?lang=%s&units=%s" \
+			% (WEATHER_API_TOKEN, latitude, longitude,\
+			   WEATHER_LANG, WEATHER_UNIT)
+		req = client.Get('darksky', weather_req_url, True)		# fetch data from URL
+		if req is None:											# not modified
+			return None
+		weather_obj = loads(req.text) 							# convert fetched data to object
+		### Assign weather information to variables ###
+		degree_sign = u'\N{DEGREE SIGN}'
+		icon_id = weather_obj['currently']['icon']				# Weather icon id
+		weather = {
+			'location': location,
+			'temperature': "%s%s" % \
+				(str(int(weather_obj['currently']['temperature'])), \
+				 degree_sign),										# Current temperature
+			'currently': weather_obj['currently']['summary'], 	# Current Weather
+			'forecast': weather_obj['hourly']['summary'],		# Frorecast
+			'icon': ICON_LOOKUP.get(icon_id)					# weather icon lookup
+		}
+		cache.Put('weather', weather)
+		return weather
+
+	def ShowWeather(self, _weather: dict):
+		"""	Runs on the Tk thread, only touches labels that changed """
+		if self.location != _weather['location']:
+			self.location = _weather['location']
+			self.location_label.config(text=self.location)
+		icon_tmp = _weather['icon']
+		if icon_tmp is not None:
+			if self.icon != icon_tmp:
+				self.icon = icon_tmp							# set self.icon to the new icon
+				photo = self.icons.Photo(icon_tmp)				# prescaled tkinter image
+				self.icon_label.config(image=photo)				# apply settings to self.icon_label
+				self.icon_label.image = photo
+		else:	# remove image
+			self.icon = ''
+			self.icon_label.config(image='')
+		if self.currently != _weather['currently']:				# update all weather information
+			self.currently = _weather['currently']
+			self.currently_label.config(text=self.currently)
+		if self.forecast != _weather['forecast']:
+			self.forecast = _weather['forecast']
+			self.forecast_label.config(text=self.forecast)
+		if self.temperature != _weather['temperature']:
+			self.temperature = _weather['temperature']
+			self.temperature_label.config(text=self.temperature)
 
 
 class Clock(Frame):
@@ -228,31 +294,45 @@ class Clock(Frame):
 		self.day_label = Label(self, font=('Lato', SM_TEXT),\
 								  fg="white", bg="black")
 		self.day_label.pack(side=TOP, anchor=E)
+		self.tick = None		# pending after() id while ticking
 		self.update_time()
 
 	def update_time(self):
 		"""	update_time method
-		updates the time using system locale."""
-		with setlocale(UI_LOCALE):
-			if TIME_FORMAT == 12:
-				time_tmp = strftime('%I:%M %p')
-			else:
-				time_tmp = strftime('%H:%M')
-
-			day_tmp = strftime('%A')
-			date_tmp = strftime(DATE_FORMAT)
-
-			if time_tmp != self.time:
-				self.time = time_tmp
-				self.time_label.config(text=time_tmp)
-			if date_tmp != self.date:
-				self.date = date_tmp
-				self.date_label.config(text=date_tmp)
-			if day_tmp != self.day:
-				self.day = day_tmp
-				self.day_label.config(text=day_tmp)
-
-			self.time_label.after(200, self.update_time)
+		updates the labels that changed, returns the time used."""
+		now = datetime.now()
+		time_tmp = CLOCK_TIME(now)
+		day_tmp = CLOCK_DAY(now)
+		date_tmp = CLOCK_DATE(now)
+
+		if time_tmp != self.time:
+			self.time = time_tmp
+			self.time_label.config(text=time_tmp)
+		if date_tmp != self.date:
+			self.date = date_tmp
+			self.date_label.config(text=date_tmp)
+		if day_tmp != self.day:
+			self.day = day_tmp
+			self.day_label.config(text=day_tmp)
+		return now
+
+	def Resume(self):
+		"""	Starts ticking, once per minute on the minute """
+		if self.tick is None:
+			self.__Tick()
+
+	def Pause(self):
+		"""	Stops ticking while nobody can see the clock """
+		if self.tick is not None:
+			self.after_cancel(self.tick)
+			self.tick = None
+
+	def __Tick(self):
+		wakeups.Count(cfg.CLOCK_NAME)
+		now = self.update_time()
+		# Date changes at midnight, also a minute boundary
+		untilNextMinute = 60000 - (now.second * 1000 + now.microsecond // 1000)
+		self.tick = self.after(untilNextMinute + 20, self.__Tick)
 
 
 class News(Frame):
@@ -260,9 +340,10 @@ class News(Frame):
 	News class
 	Fetches news from BBC RSS feed and outputs top 5 headlines.
 	"""
-	def __init__(self, parent):
+	def __init__(self, parent, fetcher):
 		"""	contructor, stores headline data for News object """
 		Frame.__init__(self, parent)
+		self.fetcher = fetcher
 		self.config(bg='black')
 		self.title = 'News'
 		self.news_label = Label(self, text=self.title, \
@@ -273,38 +354,63 @@ class News(Frame):
 							  fg='white', bg='black', wraplength = 800)
 		self.headlines_label.pack(side=TOP, anchor=E)
 
-		self.get_news()
+		WarmStart('headlines', self.ShowNews)
+		self.refresher = Refresher(self, cfg.NEWS_NAME, NEWS_REFRESH, self.Refresh)
+		self.refresher.Now()
 
-	def get_news(self):
-		"""	fetches XML data from the BBC using feedparser """
-		try:
-			# reset headline info in headline_container
-			self.headlines_label.config(text="")
-
-			### Fetch XML data from news website ###
-			# store XML url in variable
-			news_url = "http://feeds.bbci.co.uk/news/uk/rss.xml"
-			# parse XML data into Python object and store in variable
-			feed = parse(news_url)
-			# store headlines in array
-			headlines = []
-			# iterate through XML and store first 5 headlines in self.headlines
-			index = 0
-			for item in feed.entries[0:5]:
-				# create child widgets containing
-				headlines.insert(index, item.title)
-				index += 1
-
-			# join the contents of headlines into
-			headlines_tmp = '\n'.join(headlines)
-			self.headlines_label.config(text=headlines_tmp)
-		except Exception as exc:
-			print_exc()
-			print("Error %s. Cannot get news." % exc)
-		self.after(300000, self.get_news)
+	def Resume(self):
+		"""	Shown, refreshes at once if the headlines are stale """
+		self.refresher.Resume()
+
+	def Pause(self):
+		self.refresher.Pause()
+
+	def Refresh(self):
+		"""	Starts a background fetch, results arrive in ShowNews """
+		self.fetcher.Submit(cfg.NEWS_NAME, self.FetchNews, self.ShowNews,
+			self.refresher.Done)
+
+	@staticmethod
+	def FetchNews() -> list:
+		"""	fetches XML data from the BBC using feedparser,
+		runs on a fetch worker. Returns None if the feed
+		hasn't changed since the last fetch. """
+		### Fetch XML data from news website ###
+		# store XML url in variable
+		news_url = "http://feeds.bbci.co.uk/news/uk/rss.xml"
+		req = client.Get('bbc', news_url, True)
+		if req is None:			# not modified, nothing to parse
+			return None
+		# parse XML data into Python object and store in variable
+		feed = parse(req.content)
+		# store first 5 headlines
+		headlines = [item.title for item in feed.entries[0:5]]
+		cache.Put('headlines', headlines)
+		return headlines
+
+	def ShowNews(self, _headlines: list):
+		"""	Runs on the Tk thread """
+		# join the contents of headlines into
+		headlines_tmp = '\n'.join(_headlines)
+		self.headlines_label.config(text=headlines_tmp)
 		
 class ThunderBoardSensor(Frame):
-	""" Displays all sensors reading on the thunderbird"""
+	""" Displays all sensors reading on the thunderbird.
+		Every metric has its own label, which is only reconfigured
+		when its rounded value changes. While the widget is hidden
+		readings are only stored, Resume() shows the latest one. """
+	# Reading key, label and decimals shown
+	FIELDS = (
+		('temperature', "Temperature: ", 1),
+		('humidity', "Humidity: ", 1),
+		('ambientLight', "Ambient Light: ", 0),
+		('uvIndex', "UV index: ", 0),
+		('co2', "CO2 level: ", 0),
+		('voc', "VOC level: ", 0),
+		('sound', "Sound level: ", 1),
+		('pressure', "Pressure: ", 1)
+	)
+
 	def __init__(self, parent):
 		'''Constructor'''
 		Frame.__init__(self, parent, bg='black')
@@ -313,24 +419,56 @@ class ThunderBoardSensor(Frame):
 									font=('Lato', MD_TEXT), \
 								    fg='white', bg='black')
 		self.title_label.pack(side=TOP, anchor=E)
-		self.readings_label = Label(self, text = "Thunderboard not available",
+		self.info_label = Label(self, text = "Thunderboard not available",
 								   font=('Lato', XS_TEXT),
-								   fg='white', bg='black', wraplength = 500, justify = LEFT)
-		self.readings_label.pack(side=TOP, anchor=E)
+								   fg='white', bg='black', wraplength = 500, justify = RIGHT)
+		self.info_label.pack(side=TOP, anchor=E)
+		self.labels = {'info': self.info_label}
+		for key, name, digits in self.FIELDS:
+			self.labels[key] = Label(self, text = "", font=('Lato', XS_TEXT),
+								   fg='white', bg='black')
+			self.labels[key].pack(side=TOP, anchor=E)
+		self.shown = dict()			# key -> text on the label
+		self.latest = None			# newest reading, shown or not
+		self.visible = False
+		self.updates = 0			# readings received
+		self.configures = 0			# labels changed
+		WarmStart('thunderboard', lambda cached: self.UpdateReadings(
+			dict(cached, info=str(cached['info']) + " (cached)")))
 
 	def UpdateReadings(self, data):
-		message = (str(data["info"]) + "\n" + 
-					"Temperature: " + str(data["temperature"]) + "\n" + 
-					"Humidity: " + str(data["humidity"]) + "\n" + 
-					"Ambient Light: " + str(data["ambientLight"]) + "\n" + 
-					"UV index: " + str(data["uvIndex"]) + "\n" + 
-					"CO2 level: " + str(data["co2"]) + "\n" + 
-					"VOC level: " + str(data["voc"]) + "\n" + 
-					"Sound level: " + str(data["sound"]) + "\n" + 
-					"Pressure: " + str(data["pressure"]) + "\n")
-		self.readings_label.config(text=message)	
-			
-			
+		self.latest = data
+		self.updates += 1
+		if self.visible:
+			self.__Render()
+
+	def Resume(self):
+		""" Widget is on screen, shows the latest reading """
+		self.visible = True
+		self.__Render()
+
+	def Pause(self):
+		""" Widget is hidden, keeps readings without drawing them """
+		self.visible = False
+
+	@staticmethod
+	def Format(_value, _digits) -> str:
+		if isinstance(_value, (int, float)) and not isinstance(_value, bool):
+			return "%.*f" % (_digits, _value)
+		return str(_value)
+
+	def __Render(self):
+		if self.latest is None:
+			return
+		texts = {'info': str(self.latest.get("info", ""))}
+		for key, name, digits in self.FIELDS:
+			texts[key] = name + self.Format(self.latest.get(key, ""), digits)
+		for key, text in texts.items():
+			if self.shown.get(key) != text:
+				self.labels[key].config(text=text)
+				self.shown[key] = text
+				self.configures += 1
+
 
 class Alexa(Frame):
 	""" Prints the sent textfields what are passed in."""
@@ -414,16 +552,32 @@ class BuildGUI(threading.Thread):
 		"""
 		self.NOTIF_VISIBLE = _notif_ttl
 		self.ALEXA_VISIBLE = _alexa_ttl
-		# Variables to store names of overwritten widgets
-		self.lastBeforeAlexa = None
-		self.lastBeforeNotif = None
-		self.lastNotification = datetime.min
+		# Position -> widgets covered by overlays there, last on top
+		self.displaced = dict()
+		self.lastReading = None	# kept for a sensor widget built later
+		# Where widgets go and which one is on screen in each slot
+		self.layout = Layout(cfg.framePositions, cfg.frameWeights, cfg.OVERLAY_NAMES,
+			cfg.MarkDirty, cfg.settingsLock)	# saved in the background
+		# Seconds since construction, filled in on the Tk thread
+		self.created = time.monotonic()
+		self.startup = {'mainloop': None, 'firstPaint': None, 'firstShow': None}
+		self.ready = threading.Event()	# set once the mainloop runs
+		# Other threads reach the GUI through Post()
+		self.commands = CommandQueue()
+		# Network fetches run here, never on the Tk thread
+		self.fetcher = Fetcher(self.Post)
 		threading.Thread.__init__(self)
 		self.daemon = True
 		self.start()
 		
 	def callback(self):
 		self.root.quit()
+
+	def Post(self, _function, *args, key=None):
+		''' Thread safe way to call a BuildGUI method, it runs on
+		the Tk thread. Commands with the same key coalesce.
+		Returns a Future with the method's result. '''
+		return self.commands.Post(_function, *args, key=key)
 		
 	def run(self):
 		# Creating Window, config
@@ -442,40 +596,16 @@ class BuildGUI(threading.Thread):
 		self.root.grid_columnconfigure(3, weight=0, minsize = 360)
 
 		# ---------------------------------------------------
-		# Creating Frames
+		# Creating Frames, widgets are built on first show
+		# or while the Tk thread is idle
 		# ---------------------------------------------------
-		
-		# clock
-		self.clock_parent = Frame(self.root, name = cfg.CLOCK_NAME, background='black')
-		self.clock = Clock(self.clock_parent)
-		self.clock.pack(side=RIGHT, padx=50, pady=50, fill=NONE, expand=NO)
-		# weather
-		self.weather_parent = Frame(self.root, name = cfg.WEATHER_NAME, background='black')
-		self.weather = Weather(self.weather_parent)
-		self.weather.pack(side=LEFT, padx=50, pady=50, fill=NONE, expand=NO)
-		# news
-		self.news_parent = Frame(self.root, name = cfg.NEWS_NAME, background='black')
-		self.news = News(self.news_parent)
-		self.news.pack(side=RIGHT, padx=50, pady=50, fill=NONE, expand=NO)
-		self.news.headlines_label.config(justify=RIGHT)
-		# alexa
-		self.alexa_parent = Frame(self.root, name = cfg.ALEXA_NAME, background='black')
-		self.alexa = Alexa(self.alexa_parent, self.ALEXA_VISIBLE)
-		self.alexa.pack(side=LEFT, padx=50, pady=50, fill=NONE, expand=NO)
-		self.alexa.alexa_label.config(justify=RIGHT)
-		# thunderboard
-		self.thunderboard_parent = Frame(self.root, name = cfg.SENSORS_NAME, background='black')
-		self.thunderboard = ThunderBoardSensor(self.thunderboard_parent)
-		self.thunderboard.pack(side=RIGHT, padx=50, pady=50, fill=NONE, expand=NO)
-		self.thunderboard.readings_label.config(justify=RIGHT)
-		# Notification Overlay
-		self.overlay_frame = Frame(self.root, name = cfg.NOTIF_NAME, background='black')
-		self.notif = PopUp(self.overlay_frame)
-		self.notif.pack(side=RIGHT, padx=50, pady=50, fill=NONE, expand=NO)
-		# guide
-		self.guide_frame = Frame(self.root, name = cfg.GUIDE_NAME, background='black')
-		self.guide = Guide(self.guide_frame)
-		self.guide.pack(side=LEFT, padx=50, pady=50, fill=NONE, expand=NO)
+		self.clock_parent = LazyFrame(self.root, cfg.CLOCK_NAME, self.__BuildClock, background='black')
+		self.weather_parent = LazyFrame(self.root, cfg.WEATHER_NAME, self.__BuildWeather, background='black')
+		self.news_parent = LazyFrame(self.root, cfg.NEWS_NAME, self.__BuildNews, background='black')
+		self.alexa_parent = LazyFrame(self.root, cfg.ALEXA_NAME, self.__BuildAlexa, background='black')
+		self.thunderboard_parent = LazyFrame(self.root, cfg.SENSORS_NAME, self.__BuildSensors, background='black')
+		self.overlay_frame = LazyFrame(self.root, cfg.NOTIF_NAME, self.__BuildNotif, background='black')
+		self.guide_frame = LazyFrame(self.root, cfg.GUIDE_NAME, self.__BuildGuide, background='black')
 
 		# Module Mappings
 		self.frames = {
@@ -504,7 +634,7 @@ class BuildGUI(threading.Thread):
                             self.ToggleFrame(a))
 		self.root.bind("5", lambda event, a="sensors": 
                             self.ToggleFrame(a))
-		self.root.bind("6", self.SendNotification)
+		self.root.bind("6", lambda event: self.SendNotification("Test notification"))
 		self.root.bind("7", self.GuiOff)
 		self.root.bind("8", self.GuiOn)
 		self.root.bind("9", lambda event, a="alexa", b="test", c=datetime.now(): 
@@ -512,28 +642,125 @@ class BuildGUI(threading.Thread):
 		self.root.bind("<Escape>", self.GuiOn)
 		
 		
+		# Notifications and Alexa cards, expired by their own timers
+		self.notices = NotificationScheduler(self.__ShowOverlay, self.__HideOverlay,
+			self.root.after, self.root.after_cancel)
+
 		# Gui is disabled by Default
 		self.GuiOff()
-		self.__HideNotifications()
+		self.commands.Attach(self.root)
+		# Widgets GuiOn would show are built first, the rest on demand
+		self.prebuild = self.PreferredWidgets()
+		self.root.after_idle(self.__Prebuild)
+		self.root.after(0, self.__MarkMainloop)
 		self.root.mainloop()
-	
-	def __HideNotifications(self):
-		''' Hides notifications after a given time 
-		specified in config '''
-		if self.overlay_frame.winfo_ismapped() and \
-				(self.lastNotification + timedelta(seconds = self.NOTIF_VISIBLE)) < datetime.now():
-			self.overlay_frame.grid_forget()
-			if self.lastBeforeNotif is not None: # Bring the overwritten widget back
-				self.ToggleFrame(self.lastBeforeNotif)
-				self.lastBeforeNotif = None # Reset
-		if self.alexa_parent.winfo_ismapped() and \
-				(self.alexa.lastMessage + timedelta(seconds = self.ALEXA_VISIBLE)) < datetime.now():
-			self.alexa_parent.grid_forget()
-			print(self.alexa.lastMessage)
-			if self.lastBeforeAlexa is not None:
-				self.ToggleFrame(self.lastBeforeAlexa)
-				self.lastBeforeAlexa = None
-		self.root.after(1000, lambda: self.__HideNotifications())	
+
+# ---------------------------------------------------
+# Widget factories, called once by LazyFrame
+# ---------------------------------------------------
+	def __BuildClock(self, _parent):
+		clock = Clock(_parent)
+		clock.pack(side=RIGHT, padx=50, pady=50, fill=NONE, expand=NO)
+		return clock
+
+	def __BuildWeather(self, _parent):
+		weather = Weather(_parent, self.fetcher)
+		weather.pack(side=LEFT, padx=50, pady=50, fill=NONE, expand=NO)
+		return weather
+
+	def __BuildNews(self, _parent):
+		news = News(_parent, self.fetcher)
+		news.pack(side=RIGHT, padx=50, pady=50, fill=NONE, expand=NO)
+		news.headlines_label.config(justify=RIGHT)
+		return news
+
+	def __BuildAlexa(self, _parent):
+		alexa = Alexa(_parent, self.ALEXA_VISIBLE)
+		alexa.pack(side=LEFT, padx=50, pady=50, fill=NONE, expand=NO)
+		alexa.alexa_label.config(justify=RIGHT)
+		return alexa
+
+	def __BuildSensors(self, _parent):
+		sensors = ThunderBoardSensor(_parent)
+		sensors.pack(side=RIGHT, padx=50, pady=50, fill=NONE, expand=NO)
+		if self.lastReading is not None:		# arrived before the widget
+			sensors.UpdateReadings(self.lastReading)
+		return sensors
+
+	def __BuildNotif(self, _parent):
+		notif = PopUp(_parent)
+		notif.pack(side=RIGHT, padx=50, pady=50, fill=NONE, expand=NO)
+		return notif
+
+	def __BuildGuide(self, _parent):
+		guide = Guide(_parent)
+		guide.pack(side=LEFT, padx=50, pady=50, fill=NONE, expand=NO)
+		return guide
+
+	def __Prebuild(self):
+		''' Builds one widget per idle pass, so commands and input
+		are handled in between '''
+		while self.prebuild:
+			frame = self.frames[self.prebuild.pop(0)]
+			if frame.widget is None:
+				frame.Build()
+				break
+		if self.prebuild:
+			self.root.after_idle(self.__Prebuild)
+
+	def __MarkMainloop(self):
+		self.startup['mainloop'] = time.monotonic() - self.created
+		self.ready.set()
+		print("GUI mainloop after %.3f s" % self.startup['mainloop'])
+
+	def __MarkPaint(self, _shown):
+		''' Idle callback queued behind the first GuiOn's redraw '''
+		now = time.monotonic()
+		self.startup['firstPaint'] = now - self.created
+		self.startup['firstShow'] = now - _shown
+		print("GUI first paint after %.3f s, %.3f s after GuiOn" %
+			(self.startup['firstPaint'], self.startup['firstShow']))
+
+	def Timings(self) -> dict:
+		''' Startup times in seconds and how long each widget took
+		to build, None for widgets not built yet '''
+		timings = dict(self.startup)
+		timings['widgets'] = {name: frame.buildSeconds
+			for name, frame in self.frames.items()}
+		return timings
+
+	def __ShowOverlay(self, _notice):
+		''' Puts a notice on its overlay, remembering what it covers '''
+		if _notice.overlay == cfg.NOTIF_NAME:
+			self.overlay_frame.Build().UpdateText(_notice.content)
+		else:
+			self.alexa_parent.Build().GetText(*_notice.content)
+		if self.layout.IsShown(_notice.overlay):
+			return
+		position = self.layout.Position(_notice.overlay)
+		occupant = self.layout.Occupant(position)
+		if occupant is not None:
+			self.displaced.setdefault(position, []).append(occupant)
+		self.ToggleFrame(_notice.overlay)
+
+	def __HideOverlay(self, _notice):
+		''' Takes an expired overlay off and brings back what it
+		covered, which may be another overlay that is still on '''
+		wakeups.Count(_notice.overlay)
+		position = self.layout.Position(_notice.overlay)
+		stack = self.displaced.get(position, [])
+		if not self.layout.IsShown(_notice.overlay):
+			# Covered by another overlay, or replaced by hand
+			if _notice.overlay in stack:
+				stack.remove(_notice.overlay)
+			occupant = self.layout.Occupant(position)
+			if occupant is not None and not self.notices.IsActive(occupant):
+				stack.clear()		# The slot was taken over, nothing to restore
+			return
+		self.frames[_notice.overlay].grid_forget()
+		self.layout.Hide(_notice.overlay)
+		if stack:
+			self.ToggleFrame(stack.pop())
 		
 	def toggle_fullscreen(self, event=None):
 		""" toggles the GUI's fullscreen state when user presses return	"""
@@ -554,9 +781,7 @@ class BuildGUI(threading.Thread):
 		'''Same as ToggleFrame, but with weight
 		increment (user action happened)'''
 		if self.ToggleFrame(_frame):
-			value = cfg.frameWeights.get(_frame)
-			value += 1
-			cfg.frameWeights[_frame] = value
+			self.layout.AddWeight(_frame, 1)
 			return True
 		else:
 			return False
@@ -565,9 +790,8 @@ class BuildGUI(threading.Thread):
 		'''Hides and decrements weighting by 1'''
 		try:	
 			self.frames[_frame].grid_forget()
-			value = cfg.frameWeights.get(_frame)
-			value -= 1
-			cfg.frameWeights[_frame] = value
+			self.layout.Hide(_frame)
+			self.layout.AddWeight(_frame, -1)
 			return True
 		except Exception as e:
 			print_exc()
@@ -578,9 +802,10 @@ class BuildGUI(threading.Thread):
 	def GuiOff(self, event=None) -> bool:
 		""" Removes all widgets from the screen """
 		try:
-			frames = list(self.root.winfo_children())
-			for frame in frames:
-				frame.grid_forget()
+			for name in self.layout.HideAll():
+				self.frames[name].grid_forget()
+			self.displaced.clear()		# Nothing to bring back on a dark screen
+			wakeups.SetState(False)
 			return True
 		except Exception as e:
 			print_exc()
@@ -592,36 +817,28 @@ class BuildGUI(threading.Thread):
 		If there are more widgets for the same space, 
 		Uses the most asked for one.'''
 		try:
-			positions = dict()
-			# Collects widgets positions, exlucdes ALEXA_NAME and NOTIF_NAME
-			for name, position in cfg.framePositions.items():  
-				if str(name) == cfg.ALEXA_NAME or str(name) == cfg.NOTIF_NAME: 	# Exceptions
-					pass
-				elif str(position) in positions: # Existing position, append
-					temp = positions.get(str(position))
-					temp.append(name)
-					positions[str(position)] = temp
-				else:
-					positions[str(position)] = [str(name)] # New position
-			# Selects most asked for widget for each position		
-			for position, names in positions.items():
-				widgetWeights = dict()
-				for name in names:
-					widgetWeights[str(name)] = cfg.frameWeights[name]
-				highestWidget = max(widgetWeights, key=widgetWeights.get)
-				self.ToggleFrame(highestWidget)
+			shown = time.monotonic()
+			for name in self.PreferredWidgets():
+				self.ToggleFrame(name)
+			wakeups.SetState(True)
+			if self.startup['firstPaint'] is None:
+				self.root.after_idle(lambda: self.__MarkPaint(shown))
 			return True
 		except Exception as e:
 			print_exc()
 			print("GuiOn failed with errors, Error: " + str(e))
 			return False
 
+	def PreferredWidgets(self) -> list:
+		''' The most asked for widget of each position '''
+		return self.layout.Preferred()
+
 	def ChangeFramePosition(self, _frame: str, _position: Pos) -> bool:
 		"""Changes a Widget saved Position and saves it to the mappings
 		   and config."""
 		try:
-			cfg.framePositions[_frame] = _position
-			#if frame.winfo_ismapped():
+			if self.layout.Move(_frame, _position):
+				self.frames[_frame].grid_forget()
 			self.ToggleFrame(_frame)
 			return True
 		except Exception as e:
@@ -637,49 +854,125 @@ class BuildGUI(threading.Thread):
 		"""Turns a passed in widget on, hiding everything what was on the
 		   same position."""
 		try:
-			frame = self.frames.get(_frame)
-			#----------------------------------------------------
-			# Hide modules visible at the same position
-			for name, position in cfg.framePositions.items():   
-				if position == cfg.framePositions[frame.winfo_name()]:
-					if self.frames[name].winfo_ismapped():
-						self.frames[name].grid_forget()
-			#----------------------------------------------------
+			# Built before the layout changes, a widget that fails
+			# to build leaves the slot as it was
+			self.frames[_frame].Build()
+			# Hide the module visible at the same position
+			displaced = self.layout.Show(_frame)
+			if displaced is not None and displaced != _frame:
+				self.frames[displaced].grid_forget()
 			# Show given frame
-			frame.grid(
-				row = cfg.framePositions[frame.winfo_name()].value.row, 
-				column = cfg.framePositions[frame.winfo_name()].value.column, 
-				sticky = cfg.framePositions[frame.winfo_name()].value.alignment)
+			self.__Grid(_frame)
 			return True
 		except Exception as e:
 			print_exc()
 			print("Can't turn widget on, Error: " + str(e))
 			return False
 		
-	def SendNotification(self, _text, event=None):
-		for name, position in cfg.framePositions.items():   
-			if position == cfg.framePositions[cfg.NOTIF_NAME]:
-				if self.frames[name].winfo_ismapped():
-					self.lastBeforeNotif = name # Important to bring back widget
-					self.frames[name].grid_forget() 
-		self.notif.UpdateText(_text)
-		self.ToggleFrame(cfg.NOTIF_NAME)
-		self.lastNotification = datetime.now()
+	def __Grid(self, _frame: str):
+		position = self.layout.Position(_frame)
+		self.frames[_frame].grid(
+			row = position.value.row, 
+			column = position.value.column, 
+			sticky = position.value.alignment)
+
+	def ApplyLayout(self, _operations: list, _save=None) -> dict:
+		"""Applies validated (operation, widget, value) tuples in one
+		   go: move to a position, set a weight, show or hide with a
+		   weight change, widget 'all' for every preferred one. Only
+		   frames whose slot or visibility changed are regridded, in
+		   this one Tk callback, so no intermediate state is drawn.
+		   Saves the result as a named layout if _save is given.
+		   Every operation is checked before anything changes, one
+		   that doesn't fit raises ValueError and nothing is applied."""
+		for operation, widget, value in _operations:
+			self.__CheckOperation(operation, widget, value)
+		if _save is not None and not cfg.LAYOUT_NAME.fullmatch(str(_save)):
+			raise ValueError("Layout name " + str(_save) + " doesn't fit in config.cfg")
+		before = {name: self.layout.Position(name) for name in self.layout.Shown()}
+		for operation, widget, value in _operations:
+			if operation == 'move':
+				if self.layout.Move(widget, value):
+					self.layout.Show(widget)
+			elif operation == 'weight':
+				self.layout.SetWeight(widget, value)
+			elif operation == 'show' and widget == 'all':
+				for name in self.layout.Preferred():
+					self.layout.Show(name)
+			elif operation == 'show':
+				self.layout.Show(widget)
+				self.layout.AddWeight(widget, value)
+			elif operation == 'hide' and widget == 'all':
+				self.layout.HideAll()
+			elif operation == 'hide':
+				self.layout.Hide(widget)
+				self.layout.AddWeight(widget, value)
+		# A widget that fails to build is hidden again before
+		# anything is regridded
+		for name in self.layout.Shown():
+			try:
+				self.frames[name].Build()
+			except Exception:
+				print_exc()
+				self.layout.Hide(name)
+		after = {name: self.layout.Position(name) for name in self.layout.Shown()}
+		for name, position in before.items():
+			if after.get(name) != position:
+				self.frames[name].grid_forget()
+		for name, position in after.items():
+			if before.get(name) != position:
+				self.__Grid(name)
+		wakeups.SetState(bool(after))
+		snapshot = self.layout.Snapshot()
+		if _save is not None:
+			with cfg.settingsLock:
+				cfg.NamedLayouts[_save] = snapshot
+			cfg.MarkDirty()
+		return snapshot
+
+	def __CheckOperation(self, _operation, _widget, _value):
+		if _widget != 'all' and _widget not in self.frames:
+			raise ValueError("Unknown widget " + str(_widget))
+		if _operation == 'move' and _widget != 'all':
+			if not isinstance(_value, Pos):
+				raise ValueError("Unknown position " + str(_value) + " for " + _widget)
+		elif _operation == 'weight' and _widget != 'all':
+			if not isinstance(_value, (int, float)) or not math.isfinite(_value):
+				raise ValueError("Weight of " + _widget + " has to be a finite number")
+		elif _operation in ('show', 'hide'):
+			if not isinstance(_value, (int, float)) or not math.isfinite(_value):
+				raise ValueError("Weight change of " + str(_widget) + " has to be a finite number")
+		else:
+			raise ValueError("Unknown operation " + str(_operation) + " on " + str(_widget))
+
+	def SendNotification(self, _notice, event=None):
+		''' Queues a notification. _notice is the text, or a dict
+		with 'text' and optionally 'key', 'priority' and 'ttl'.
+		Notifications with the same key replace each other. '''
+		if not isinstance(_notice, dict):
+			_notice = {'text': str(_notice)}
+		self.notices.Push(cfg.NOTIF_NAME, _notice['text'], _notice.get('key'),
+			_notice.get('priority', 1), _notice.get('ttl', self.NOTIF_VISIBLE))
 		
 	def UpdateAlexa(self, _title, _text, _time, event=None):
-		''' Updates the text in Alexa Frame
+		''' Queues a card for the Alexa Frame, cards are shown in
+		order, a repeat of a waiting or showing card replaces it
 		'''
-		# Hide modules visible at the same position
-		for name, position in cfg.framePositions.items():   
-			if position == cfg.framePositions[cfg.ALEXA_NAME]:
-				if self.frames[name].winfo_ismapped() and not name == cfg.ALEXA_NAME:
-					self.lastBeforeAlexa = name  # Important to bring back widget
-					self.frames[name].grid_forget()
-		self.alexa.GetText(_title, _text, _time)
-		self.ToggleFrame(cfg.ALEXA_NAME)
+		self.notices.Push(cfg.ALEXA_NAME, (_title, _text, _time), (_title, _text),
+			1, self.ALEXA_VISIBLE)
 		
+	def SetTTLs(self, _alexa_ttl: int, _notif_ttl: int):
+		''' New overlay lifetimes, for notices pushed from now on '''
+		self.ALEXA_VISIBLE = _alexa_ttl
+		self.NOTIF_VISIBLE = _notif_ttl
+		if self.alexa_parent.widget is not None:
+			self.alexa_parent.widget.ALEXA_VISIBLE = _alexa_ttl
+
 	def UpdateThunderboard(self, _data, event=None):
-		self.thunderboard.UpdateReadings(_data)
+		self.lastReading = _data
+		if self.thunderboard_parent.widget is not None:
+			self.thunderboard_parent.widget.UpdateReadings(_data)
+		cache.Put('thunderboard', _data)
 	
 # Self Init
 #def run():
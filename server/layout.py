@@ -0,0 +1,114 @@
+#!/usr/bin/python3
+import threading
+from bisect import insort
+
+
+class Layout():
+	''' Which widget goes where. Keeps position -> occupants with
+		each slot's occupants ranked by weight, and which widget is
+		on screen in every slot, so nothing has to scan all widgets
+		or ask Tk what is mapped. Positions and weights are the
+		config dictionaries themselves and are kept up to date.
+		Overlays take a slot when shown but are never preferred.
+		_onChange() is called whenever a position or weight changes,
+		the dictionaries are only changed while holding _lock, which
+		other threads reading them hold too.
+	'''
+	def __init__(self, _positions: dict, _weights: dict, _overlays=(), _onChange=None,
+			_lock=None):
+		self.positions = _positions		# name -> Pos
+		self.weights = _weights			# name -> weight
+		self.overlays = set(_overlays)
+		self.onChange = _onChange or (lambda: None)
+		self.lock = _lock or threading.Lock()
+		self.order = {name: i for i, name in enumerate(_positions)}	# ties go to the first
+		self.ranking = dict()			# Pos -> [(-weight, order, name)], best first
+		self.ranks = dict()				# name -> its entry in a ranking
+		self.shown = dict()				# Pos -> name on screen
+		for name in _positions:
+			self.__Rank(name)
+
+	def Position(self, _name: str):
+		return self.positions[_name]
+
+	def Occupant(self, _position):
+		''' Name on screen at _position, None if the slot is empty '''
+		return self.shown.get(_position)
+
+	def IsShown(self, _name: str) -> bool:
+		return self.shown.get(self.positions[_name]) == _name
+
+	def Shown(self) -> list:
+		return list(self.shown.values())
+
+	def Preferred(self) -> list:
+		''' The highest weighted widget of every slot '''
+		preferred = []
+		for ranking in self.ranking.values():
+			if ranking:
+				preferred.append(ranking[0][2])
+		return preferred
+
+	def Show(self, _name: str):
+		''' Marks _name as on screen, returns the widget it displaces
+		or None. Returns _name itself if it was already shown. '''
+		position = self.positions[_name]
+		displaced = self.shown.get(position)
+		self.shown[position] = _name
+		return displaced
+
+	def Hide(self, _name: str) -> bool:
+		''' False if _name wasn't on screen '''
+		position = self.positions[_name]
+		if self.shown.get(position) != _name:
+			return False
+		del self.shown[position]
+		return True
+
+	def HideAll(self) -> list:
+		''' Empties every slot, returns what was shown '''
+		shown = list(self.shown.values())
+		self.shown.clear()
+		return shown
+
+	def Move(self, _name: str, _position) -> bool:
+		''' Moves _name to another slot, returns whether it was on
+		screen. It is taken off screen, the caller shows it again. '''
+		wasShown = self.Hide(_name)
+		self.__Unrank(_name)
+		with self.lock:
+			self.positions[_name] = _position
+		self.__Rank(_name)
+		self.onChange()
+		return wasShown
+
+	def AddWeight(self, _name: str, _delta: float):
+		self.SetWeight(_name, self.weights.get(_name, 0) + _delta)
+
+	def SetWeight(self, _name: str, _weight: float):
+		self.__Unrank(_name)
+		with self.lock:
+			self.weights[_name] = _weight
+		self.__Rank(_name)
+		self.onChange()
+
+	def Snapshot(self) -> dict:
+		''' Positions by name, weights and what is on screen
+		besides the overlays, which come and go on their own '''
+		with self.lock:
+			positions = {name: position.name for name, position in self.positions.items()}
+			weights = dict(self.weights)
+		return {'positions': positions, 'weights': weights,
+			'shown': [name for name in self.Shown() if name not in self.overlays]}
+
+	def __Rank(self, _name: str):
+		if _name in self.overlays:
+			return
+		ranking = self.ranking.setdefault(self.positions[_name], [])
+		self.ranks[_name] = (-self.weights[_name], self.order[_name], _name)
+		insort(ranking, self.ranks[_name])
+
+	def __Unrank(self, _name: str):
+		if _name in self.overlays:
+			return
+		self.ranking[self.positions[_name]].remove(self.ranks[_name])
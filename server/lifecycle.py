@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+import time
+import threading
+from tkinter import Frame
+
+
+class WakeupCounter():
+	''' Times the Tk thread woke up for scheduled work, by source,
+		split by whether the display was on or off at the time.
+	'''
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.state = 'off'			# GUI is off until the first GuiOn
+		self.since = time.monotonic()
+		self.seconds = {'on': 0.0, 'off': 0.0}
+		self.counts = {'on': dict(), 'off': dict()}		# state -> source -> wakeups
+
+	def SetState(self, _on: bool):
+		''' Called when the display turns on or off '''
+		now = time.monotonic()
+		with self.lock:
+			self.seconds[self.state] += now - self.since
+			self.since = now
+			self.state = 'on' if _on else 'off'
+
+	def Count(self, _source: str):
+		with self.lock:
+			counts = self.counts[self.state]
+			counts[_source] = counts.get(_source, 0) + 1
+
+	def Stats(self) -> dict:
+		''' Wakeups per second in each state, and per source '''
+		now = time.monotonic()
+		with self.lock:
+			seconds = dict(self.seconds)
+			seconds[self.state] += now - self.since
+			stats = {'state': self.state}
+			for state, counts in self.counts.items():
+				total = sum(counts.values())
+				stats[state] = {'seconds': round(seconds[state], 1), 'wakeups': total,
+					'perSecond': total / seconds[state] if seconds[state] > 0 else 0.0,
+					'sources': dict(counts)}
+			return stats
+
+
+class Refresher():
+	''' Calls _refresh every _period seconds on the Tk thread, but
+		only while resumed. Resume() refreshes once straight away if
+		the last refresh is older than the period, otherwise it waits
+		out the rest of it. Pause() drops the pending refresh.
+		_refresh may finish later, the refresh only counts once
+		Done() is called, so a failed one is retried on Resume().
+	'''
+	def __init__(self, _widget, _name: str, _period: float, _refresh):
+		self.widget = _widget			# any Tk widget, for after()
+		self.name = _name
+		self.period = _period
+		self.refresh = _refresh
+		self.last = float('-inf')		# monotonic time of the last successful refresh
+		self.pending = None				# after() id while resumed
+
+	def Resume(self):
+		if self.pending is not None:
+			return
+		due = self.last + self.period - time.monotonic()
+		if due <= 0:
+			self.__Run()
+		else:
+			self.pending = self.widget.after(int(due * 1000), self.__Run)
+
+	def Pause(self):
+		if self.pending is not None:
+			self.widget.after_cancel(self.pending)
+			self.pending = None
+
+	def Now(self):
+		''' Refreshes without touching the schedule '''
+		self.refresh()
+
+	def Done(self):
+		''' Records a successful refresh, from any thread '''
+		self.last = time.monotonic()
+
+	def __Run(self):
+		wakeups.Count(self.name)
+		self.Now()
+		self.pending = self.widget.after(int(self.period * 1000), self.__Run)
+
+
+class LazyFrame(Frame):
+	''' Frame whose widget is made by _factory(frame) the first time
+		the frame is gridded, or earlier by Build(). From then on a
+		widget with Resume() and Pause() follows the frame's <Map>
+		and <Unmap>, so it only schedules work while on screen.
+	'''
+	def __init__(self, _master, _name: str, _factory, **options):
+		Frame.__init__(self, _master, name=_name, **options)
+		self.factory = _factory
+		self.widget = None
+		self.buildSeconds = None
+
+	def Build(self):
+		''' The widget, built on the first call '''
+		if self.widget is None:
+			start = time.monotonic()
+			self.widget = self.factory(self)
+			self.buildSeconds = time.monotonic() - start
+			if hasattr(self.widget, 'Resume') and hasattr(self.widget, 'Pause'):
+				self.bind("<Map>", lambda event: self.widget.Resume())
+				self.bind("<Unmap>", lambda event: self.widget.Pause())
+		return self.widget
+
+	def grid(self, cnf={}, **options):
+		self.Build()
+		Frame.grid(self, cnf, **options)
+
+
+# Counted by every scheduled job on the Tk thread
+wakeups = WakeupCounter()
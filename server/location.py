@@ -0,0 +1,74 @@
+#!/usr/bin/python3
+import time
+import threading
+from json import loads
+
+from server.httpclient import client
+from server.snapshot import cache
+
+IP_RECHECK = 3600		# seconds between public IP checks
+MAX_KNOWN_IPS = 8		# locations remembered, one per public IP
+
+
+class LocationResolver():
+	''' Works out where the mirror is. The public IP is checked
+		against ipify at most once per IP_RECHECK seconds and
+		ipstack, which is quota limited, is only asked about IPs
+		it hasn't resolved before. A fixed location skips both.
+	'''
+	def __init__(self, _token: str, _fixed=None):
+		''' _fixed is (latitude, longitude, name) or None '''
+		self.token = _token
+		self.fixed = _fixed
+		self.lock = threading.Lock()
+		self.current = None
+		self.lastCheck = float('-inf')
+		self.lookups = 0		# ipstack calls made
+
+	def Resolve(self):
+		''' Returns (latitude, longitude, location text) '''
+		if self.fixed is not None:
+			return tuple(self.fixed)
+		with self.lock:
+			if self.current is not None and \
+					time.monotonic() - self.lastCheck < IP_RECHECK:
+				return self.current
+			known = cache.Get('locations') or dict()
+			try:
+				ip = self.get_ip()
+			except Exception:
+				if self.current is None and known:	# Offline, use any known location
+					self.current = tuple(list(known.values())[-1])
+				if self.current is None:
+					raise
+				return self.current
+			self.lastCheck = time.monotonic()
+			if ip not in known:
+				known = dict(known)
+				while len(known) >= MAX_KNOWN_IPS:
+					known.pop(next(iter(known)))
+				known[ip] = self.get_location(ip)
+				cache.Put('locations', known)
+			self.current = tuple(known[ip])
+			return self.current
+
+	def get_location(self, _ip: str):
+		"""	Method to fetch device location based upon IP address. """
+		### Fetch location using ipstack API ###
+		location_req_url = ("http://api.ipstack.com/" + _ip +
+							"?access_key=" + self.token + "&output=json&legacy=1")
+		req = client.Get('ipstack', location_req_url)		# fetch data from URL
+		location_obj = loads(req.text)						# convert fetched data to object
+		self.lookups += 1
+		location_tmp = "%s, %s" % \
+				(location_obj['city'], location_obj['region_code'])
+		return [location_obj['latitude'], location_obj['longitude'], location_tmp]
+
+	@staticmethod
+	def get_ip():
+		"""	gets the IP address of the device and returns it """
+		### Fetch IP address using IPify API ###
+		ip_url = "https://api.ipify.org?format=json"
+		req = client.Get('ipify', ip_url)			# fetch data from URL
+		ip_obj = loads(req.text)					# convert fetched data to object
+		return ip_obj['ip']							# return value
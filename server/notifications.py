@@ -0,0 +1,128 @@
+#!/usr/bin/python3
+import time
+import heapq
+import itertools
+
+
+class Notice():
+	''' One message for an overlay. Notices with the same key are
+		the same message, a newer one replaces an older one. '''
+	def __init__(self, _overlay: str, _content, _key, _priority: int, _ttl: float):
+		self.overlay = _overlay
+		self.content = _content
+		self.key = _key
+		self.priority = _priority
+		self.ttl = _ttl
+		self.order = None			# place in line, kept when interrupted
+		self.cancelled = False		# superseded while queued
+
+
+class NotificationScheduler():
+	''' Decides what each overlay shows. An overlay shows one notice
+		at a time for its TTL, the rest wait in a priority queue and
+		are shown highest priority first, oldest first within one.
+		A notice with the key of the one on screen updates it and
+		starts its TTL over, one with the key of a queued notice
+		replaces it. A higher priority notice takes the screen right
+		away and the one it interrupts goes back to its place in the
+		queue with the time it had left. Expiry is a timer per overlay, no polling.
+		_show(notice) and _hide(notice) draw, _schedule(ms, callback)
+		and _cancel(job) are the Tk after() and after_cancel().
+	'''
+	def __init__(self, _show, _hide, _schedule, _cancel):
+		self.show = _show
+		self.hide = _hide
+		self.schedule = _schedule
+		self.cancel = _cancel
+		self.queues = dict()		# overlay -> heap of (-priority, notice.order, notice)
+		self.queued = dict()		# (overlay, key) -> notice waiting
+		self.current = dict()		# overlay -> notice on screen
+		self.expiry = dict()		# overlay -> (after() id, monotonic deadline)
+		self.order = itertools.count()
+		self.counts = {'pushed': 0, 'shown': 0, 'coalesced': 0, 'superseded': 0,
+			'preempted': 0, 'expired': 0}
+
+	def Push(self, _overlay: str, _content, _key=None, _priority=1, _ttl=10) -> Notice:
+		''' Shows or queues a notice, _key defaults to the content '''
+		notice = Notice(_overlay, _content, _content if _key is None else _key,
+			_priority, _ttl)
+		notice.order = next(self.order)
+		self.counts['pushed'] += 1
+		current = self.current.get(_overlay)
+		if current is not None and current.key == notice.key:
+			self.counts['coalesced'] += 1
+			notice.order = current.order
+			self.__Show(notice)
+			return notice
+		older = self.queued.pop((_overlay, notice.key), None)
+		if older is not None:
+			older.cancelled = True
+			self.counts['superseded'] += 1
+		if current is None:
+			self.__Show(notice)
+		elif notice.priority > current.priority:
+			self.counts['preempted'] += 1
+			self.__Requeue(current)
+			self.__Show(notice)
+		else:
+			self.__Enqueue(notice)
+		return notice
+
+	def Expire(self, _overlay: str):
+		''' Timer callback, moves on to the next notice or hides '''
+		self.expiry.pop(_overlay, None)
+		notice = self.current.pop(_overlay, None)
+		if notice is None:
+			return
+		self.counts['expired'] += 1
+		following = self.__Next(_overlay)
+		if following is not None:
+			self.__Show(following)		# straight over, nothing restored in between
+		else:
+			self.hide(notice)
+
+	def IsActive(self, _overlay: str) -> bool:
+		return _overlay in self.current
+
+	def Stats(self) -> dict:
+		stats = dict(self.counts)
+		stats['showing'] = {overlay: str(notice.key) for overlay, notice in self.current.items()}
+		stats['queued'] = len(self.queued)
+		return stats
+
+	def __Show(self, _notice):
+		self.current[_notice.overlay] = _notice
+		self.counts['shown'] += 1
+		self.show(_notice)
+		self.__Disarm(_notice.overlay)
+		job = self.schedule(int(_notice.ttl * 1000),
+			lambda overlay=_notice.overlay: self.Expire(overlay))
+		self.expiry[_notice.overlay] = (job, time.monotonic() + _notice.ttl)
+
+	def __Disarm(self, _overlay):
+		''' Cancels the expiry timer, returns its deadline or None '''
+		job, deadline = self.expiry.pop(_overlay, (None, None))
+		if job is not None:
+			self.cancel(job)
+		return deadline
+
+	def __Requeue(self, _notice):
+		deadline = self.__Disarm(_notice.overlay)
+		if deadline is not None:
+			_notice.ttl = max(deadline - time.monotonic(), 0.5)	# what it had left
+		del self.current[_notice.overlay]
+		self.__Enqueue(_notice)
+
+	def __Enqueue(self, _notice):
+		heapq.heappush(self.queues.setdefault(_notice.overlay, []),
+			(-_notice.priority, _notice.order, _notice))
+		self.queued[(_notice.overlay, _notice.key)] = _notice
+
+	def __Next(self, _overlay):
+		queue = self.queues.get(_overlay, [])
+		while queue:
+			notice = heapq.heappop(queue)[2]
+			if not notice.cancelled:
+				del self.queued[(_overlay, notice.key)]
+				return notice
+		return None
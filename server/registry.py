@@ -0,0 +1,61 @@
+#!/usr/bin/python3
+import os
+import json
+import threading
+from traceback import print_exc
+
+REGISTRY_FILE = 'boards.json'
+
+
+class DeviceRegistry():
+	''' Thunderboards seen so far: address, address type, name and
+		characteristic handles, by device ID. Kept on disk so a
+		restart can connect straight away without scanning or
+		GATT discovery.
+	'''
+	def __init__(self, _path=REGISTRY_FILE):
+		self.path = _path
+		self.lock = threading.Lock()
+		self.devices = dict()		# device ID -> entry
+		self.__Load()
+
+	def Ids(self) -> list:
+		with self.lock:
+			return sorted(self.devices)
+
+	def Get(self, _deviceId: int) -> dict:
+		''' Copy of the entry, None for unknown devices '''
+		with self.lock:
+			entry = self.devices.get(_deviceId)
+			return dict(entry) if entry is not None else None
+
+	def Update(self, _deviceId: int, **fields):
+		''' Adds or changes a device, saved only if something changed '''
+		with self.lock:
+			entry = self.devices.setdefault(_deviceId, {
+				'addr': None, 'addrType': None, 'name': '', 'handles': None})
+			changed = {key: value for key, value in fields.items()
+				if entry.get(key) != value}
+			if not changed:
+				return
+			entry.update(changed)
+			self.__Save()
+
+	def __Save(self):
+		''' Lock must be held '''
+		try:
+			tmpFile = self.path + '.tmp'
+			with open(tmpFile, 'w') as registry:
+				json.dump({str(deviceId): entry for deviceId, entry
+					in self.devices.items()}, registry, separators=(',', ':'))
+			os.replace(tmpFile, self.path)
+		except OSError:
+			print_exc()
+
+	def __Load(self):
+		try:
+			with open(self.path) as registry:
+				devices = json.load(registry)
+			self.devices = {int(deviceId): entry for deviceId, entry in devices.items()}
+		except (OSError, ValueError):
+			self.devices = dict()
@@ -0,0 +1,100 @@
+#!/usr/bin/python3
+import os
+import json
+import time
+import atexit
+import threading
+from traceback import print_exc
+
+SNAPSHOT_FILE = 'snapshot.json'
+MIN_WRITE_INTERVAL = 60		# seconds, bounds SD card writes
+
+# How long an entry is still worth showing after a restart, in seconds
+TTLS = {
+	'weather': 3 * 3600,
+	'locations': 30 * 24 * 3600,	# keyed by public IP, see location.py
+	'headlines': 6 * 3600,
+	'thunderboard': 15 * 60
+}
+
+
+class SnapshotCache():
+	''' Last data each widget rendered, kept on disk so the
+		widgets have something to show straight after boot.
+		Writes are compact, atomic and at most one per
+		MIN_WRITE_INTERVAL seconds. They happen on a timer thread,
+		Put() never waits for the disk.
+	'''
+	def __init__(self, _path=SNAPSHOT_FILE, _ttls=TTLS, _minInterval=MIN_WRITE_INTERVAL):
+		self.path = _path
+		self.ttls = _ttls
+		self.minInterval = _minInterval
+		self.lock = threading.Lock()		# entries and the write schedule
+		self.writeLock = threading.Lock()	# one write at a time, in order
+		self.entries = dict()		# name -> {'time': epoch seconds, 'data': ...}
+		self.lastWrite = float('-inf')
+		self.written = None			# last serialized snapshot
+		self.pending = None			# timer for a delayed write
+		self.writes = 0
+		self.__Load()
+		atexit.register(self.Flush)
+
+	def Get(self, _name: str):
+		''' Cached data for _name, or None if missing or expired '''
+		with self.lock:
+			entry = self.entries.get(_name)
+		if entry is None:
+			return None
+		if time.time() - entry['time'] > self.ttls.get(_name, 0):
+			return None
+		return entry['data']
+
+	def Put(self, _name: str, _data):
+		''' Stores _data, it has to be JSON serialisable '''
+		with self.lock:
+			entry = self.entries.get(_name)
+			unchanged = entry is not None and entry['data'] == _data
+			self.entries[_name] = {'time': time.time(), 'data': _data}
+			if unchanged:
+				return	# Newer time only, written with the next change
+			if self.pending is not None:
+				return	# Already scheduled, it will pick this up
+			delay = self.lastWrite + self.minInterval - time.monotonic()
+			self.pending = threading.Timer(max(delay, 0), self.Flush)
+			self.pending.daemon = True
+			self.pending.start()
+
+	def Flush(self):
+		''' Writes the snapshot if it changed since the last write.
+		Only serializing holds the entries' lock. '''
+		with self.writeLock:
+			with self.lock:
+				self.pending = None
+				self.lastWrite = time.monotonic()
+				serialized = json.dumps(self.entries, separators=(',', ':'))
+			if serialized == self.written:
+				return
+			try:
+				tmpFile = self.path + '.tmp'
+				with open(tmpFile, 'w') as snapshot:
+					snapshot.write(serialized)
+					snapshot.flush()
+					os.fsync(snapshot.fileno())
+				os.replace(tmpFile, self.path)
+				self.written = serialized
+				self.writes += 1
+			except OSError:
+				print_exc()
+
+	def __Load(self):
+		try:
+			with open(self.path) as snapshot:
+				self.written = snapshot.read()
+			self.entries = json.loads(self.written)
+		except (OSError, ValueError):
+			print("Snapshot not found, starting cold.")
+			self.entries = dict()
+
+
+# Shared by all widgets
+cache = SnapshotCache()
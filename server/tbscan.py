@@ -4,35 +4,48 @@ import struct
 import time
 from tbsense import Thunderboard
 import threading
-from datetime import datetime, timedelta
+from statistics import median
+from traceback import print_exc
+from server.registry import DeviceRegistry
+from server.timeseries import history
+from server.alerts import AlertEngine
 import pyglet
 
+# Board power source -> sampling policy
+POWER_POLICIES = {'unknown': 'usb', 'usb': 'usb', 'aa': 'battery', 'aaa': 'battery',
+	'coinCell': 'coin'}
 
 
 class ThunderboardHandler(threading.Thread):
 	''' Discovers Thunderboards and gets readings
-		from one, updates interface with it. 
+		from all of them, updates interface with it. 
 		Handles iMirror behaviours based on readings.
 	'''
-	def __init__(self, _interfaceCommand):
-		''' Constructor
+	def __init__(self, _interfaceCommand, _subscribe=True, _rooms=None, _registry=None,
+			_alertRules=(), _present=None, _policies=None):
+		''' Constructor. _present() tells if anyone is looking at the
+			display, _policies maps a power source to the seconds
+			between samples with the display (on, off).
 		'''	
 		# Setting Constants
-		self.MIN_TIME_BETWEEN_EVENTS = timedelta(seconds=10)
-		self.TEMP_UPPER_THRESHOLD = 30
-		self.CO2_BAD_THRESHOLD = 1000
-		self.CO2_CRITICAL_THRESHOLD = 2000
+		self.SAMPLE_INTERVAL = 0.2
+		self.IDLE_CHECK = 1			# seconds between presence checks while dark
+		self.SUBSCRIBE = _subscribe	# GATT notifications instead of polling
+		self.STALE_AFTER = 10		# seconds before a board's reading is ignored
+		self.RESCAN_INTERVAL = 300	# seconds between background scans
 		
 		# Setting variables to use later
-		self.lastNotification = datetime.min
-		self.lastTempEvent = datetime.min
-		self.lastCO2Event = datetime.min
-		self.lastVOCEvent = datetime.min
-		self.lastCO2Reading = -1
-		self.lastTempReading = -1
-		self.deviceID = -1
+		self.alerts = AlertEngine(_alertRules, self.HandleAlert)
+		self.present = _present or (lambda: True)
+		self.policies = _policies or {'usb': (self.SAMPLE_INTERVAL, self.SAMPLE_INTERVAL)}
+		self.updates = 0				# readings stored so far
+		self.ready = threading.Event()	# set with the first reading sent on
 		self.whiteSounds = []
 		self.synthetizedSpeech = []
+		self.rooms = _rooms or dict()	# device ID -> room name
+		self.lock = threading.Lock()
+		self.readings = dict()			# device ID -> (monotonic time, reading, interval)
+		self.registry = _registry if _registry is not None else DeviceRegistry()
 		
 		
 		self.CommandInterface = _interfaceCommand
@@ -46,116 +59,161 @@ class ThunderboardHandler(threading.Thread):
 # Main loop
 #--------------------------------------------------------------------
 	def run(self):
-		''' Runs when the thread starts
+		''' Runs when the thread starts. Every known board is read
+			by its own BoardWorker, this loop only combines their
+			latest readings, so its period doesn't grow with the
+			number of boards. Boards come from the registry, the
+			scanner adds new ones in the background. Only new
+			readings are combined and sent on, and while the display
+			is dark the workers slow down to their idle interval.
 		'''
-		self.thunderboards = self.CollectBoards()
-		isBoardActive = False
+		self.workers = dict()
+		self.scanner = BoardScanner(self.registry, self.RESCAN_INTERVAL)
+		reporting = False
+		lastUpdate = 0
 		while True:
-			message = ""
-			info = ""
-			if len(self.thunderboards) == 0:
+			self.AddBoards()
+			if not self.workers:
 				time.sleep(1)
-				info = ("No Thunderboard Sense devices found!")
-				self.thunderboards = self.CollectBoards()
-			else:
-				devices = list()
-				# iterating through available boards
-				for deviceID, thunderboard in self.thunderboards.items():
-					devices.append(deviceID)
-				# Selecting first available board
-				self.thunderboard = self.thunderboards[devices[0]]
-				self.deviceID = devices[0]
-				info = ("Device ID: " + str(deviceID))
-				try:
-					data = self.sensorLoop(self.thunderboard, deviceID)
-					data["info"] = info
-					self.HandleCO2(data["co2"])
-					self.HandleTemperature(data["temperature"])
-					self.CommandInterface("updateBoard", data)
-				except (IOError, BTLEException) as e:
-					print ("sensorloop error: " + str(e))
-					data = dict()
-					data["info"] = "Connection Error"
-					data["temperature"] = ""
-					data["co2"] = ""
-					data["humidity"] = ""
-					data["ambientLight"] = ""
-					data["uvIndex"] = ""
-					data["voc"] = ""
-					data["sound"] = ""
-					data["pressure"] = ""
-					self.CommandInterface("updateBoard", data)
-					self.thunderboards = self.CollectBoards()
-			time.sleep(0.2)
+				continue
+			update = self.updates
+			data = self.CombineReadings()
+			if data is None:
+				if reporting:		# Every board went quiet
+					self.CommandInterface("updateBoard", self.EmptyReading("Connection Error"))
+					reporting = False
+			elif update != lastUpdate:
+				lastUpdate = update
+				reporting = True
+				# Worst room decides, the warmest for above rules, the coldest for below
+				self.alerts.Evaluate(data["max"], _low=data["min"])
+				self.CommandInterface("updateBoard", data)
+				self.ready.set()
+			time.sleep(self.SAMPLE_INTERVAL if self.present() else self.IDLE_CHECK)
 
+	def AddBoards(self):
+		''' Starts a worker for every registered board without one '''
+		for deviceId in self.registry.Ids():
+			if deviceId not in self.workers:
+				self.workers[deviceId] = BoardWorker(deviceId, self.registry,
+					self.Policy, self.present, self.StoreReading, self.SUBSCRIBE)
 
-#-----------------------------------------------------------------
-# Reading Handler Methods
-#-----------------------------------------------------------------
-
-	def HandleTemperature(self, reading):
-		if self.AllowHandling(datetime.now()):
-			if reading >= 30 and self.lastTempReading < 30:
-				self.lastTempReading = reading
-				self.lastTempEvent = datetime.now()
-				self.lastNotification = datetime.now()
-				self.CommandInterface("notif", "Ambient Temperature above 30 celsius!")
-				
-				#song = pyglet.media.load('thesong.ogg')
-				#song.play()
-				#pyglet.app.run()
-		
-	
-	def HandleCO2(self, reading):
-		if self.AllowHandling(datetime.now()):
-			# Reading in normal levels after not normal
-			if reading < 1000 and self.lastCO2Reading > 1000:
-				self.lastCO2Reading = reading
-				self.lastNotification = datetime.now()
-				self.CommandInterface("notif", "CO2 levels are back to normal.")
-				# Reading back to normal
-			elif reading >= 1000 and reading < 2000:
-				if self.lastCO2Event + timedelta(minutes = 10) < datetime.now():
-					# Reading in not recommended range
-					self.lastNotification = datetime.now()
-					self.lastCO2Event = datetime.now()
-					self.lastCO2Reading = reading
-					self.CommandInterface("notif", "CO2 levels above recommended, open the windows.")
-			elif reading >= 2000:
-				if self.lastCO2Event + timedelta(minutes = 1) < datetime.now():
-					self.CommandInterface("notif", "CO2 levels are critical, air the room immidiately!")
-					self.lastNotification = datetime.now()
-					self.lastCO2Event = datetime.now()
-					self.lastCO2Reading = reading
-			else:
-				pass
+	def Policy(self, _board) -> tuple:
+		''' Seconds between samples of _board with the display (on, off) '''
+		policy = POWER_POLICIES.get(_board.powerSource, 'usb')
+		return self.policies.get(policy) or self.policies.get('usb') or \
+			(self.SAMPLE_INTERVAL, self.SAMPLE_INTERVAL)
 
+	def SetAlertRules(self, _rules):
+		''' Replaces the rules, their state starts over '''
+		self.alerts = AlertEngine(_rules, self.HandleAlert)
 
+	def SetRooms(self, _rooms):
+		self.rooms = dict(_rooms)
 
+	def SetPolicies(self, _policies):
+		''' Used by the workers from their next sample on '''
+		self.policies = dict(_policies)
 
+	def StoreReading(self, _deviceId, _data, _interval):
+		''' Called by the workers, _interval is when the next
+			reading is due '''
+		with self.lock:
+			self.readings[_deviceId] = (time.monotonic(), _data, _interval)
+			self.updates += 1
+		history.Record(_deviceId, _data)
 
-		
-#------------------------------------------------
-# Assist Methods
-# -----------------------------------------------  
-	def CollectBoards(self):
-		try:
-			return self.getThunderboards()
-		except Exception as e:
-			print(e)
-			time.sleep(1)
-			self.CollectBoards()
-
-	def AllowHandling(self, time):
-		if (self.lastNotification + self.MIN_TIME_BETWEEN_EVENTS) < time:
-			return True
+	def CombineReadings(self):
+		''' Widget data from the fresh readings of every board.
+			Values are the median over rooms, the highest and lowest
+			room values are in "max" and "min" and each room's values
+			in "rooms". None if no board has reported recently. A
+			reading goes stale STALE_AFTER seconds after its next one
+			was due. '''
+		now = time.monotonic()
+		with self.lock:
+			fresh = {deviceId: data for deviceId, (stamp, data, interval)
+				in self.readings.items() if now - stamp < self.STALE_AFTER + interval}
+		if not fresh:
+			return None
+		byRoom = dict()
+		for deviceId, reading in sorted(fresh.items()):
+			room = self.rooms.get(deviceId, "Board #" + str(deviceId))
+			byRoom.setdefault(room, []).append(reading)
+		rooms = {room: self.Summarise(readings, median)
+			for room, readings in byRoom.items()}
+		data = self.Summarise(rooms.values(), median)
+		data["max"] = self.Summarise(rooms.values(), max)
+		data["min"] = self.Summarise(rooms.values(), min)
+		data["rooms"] = rooms
+		if len(fresh) == 1:
+			data["info"] = "Device ID: " + str(next(iter(fresh)))
 		else:
-			return False
+			data["info"] = ", ".join(rooms) + " (median)"
+		return data
+
+	@staticmethod
+	def Summarise(_readings, _function) -> dict:
+		''' Applies _function to every metric across _readings '''
+		values = dict()
+		for reading in _readings:
+			for metric, value in reading.items():
+				if isinstance(value, (int, float)):
+					values.setdefault(metric, []).append(value)
+		return {metric: _function(column) for metric, column in values.items()}
+
+	@staticmethod
+	def EmptyReading(_info) -> dict:
+		data = dict()
+		data["info"] = _info
+		data["temperature"] = ""
+		data["co2"] = ""
+		data["humidity"] = ""
+		data["ambientLight"] = ""
+		data["uvIndex"] = ""
+		data["voc"] = ""
+		data["sound"] = ""
+		data["pressure"] = ""
+		return data
 
 
-      
+#-----------------------------------------------------------------
+# Reading Handler Methods
+#-----------------------------------------------------------------
+
+	def HandleAlert(self, rule, message):
+		''' Called by the alert engine. Alerts on one metric share
+			a key, so a newer one or its clear message replaces an
+			older one still waiting to be shown. '''
+		self.CommandInterface("notif", {'text': message, 'key': "alert " + rule.metric,
+			'priority': rule.severity})
+
+
+class BoardScanner(threading.Thread):
+	''' Scans for Thunderboards in the background and records them
+		in the registry. Scans often until a board is known, then
+		every _interval seconds to pick up new or moved boards.
+	'''
+	def __init__(self, _registry, _interval):
+		self.registry = _registry
+		self.interval = _interval
+		threading.Thread.__init__(self)
+		self.daemon = True
+		self.start()
+
+	def run(self):
+		while True:
+			try:
+				for deviceId, dev in self.getThunderboards().items():
+					self.registry.Update(deviceId, addr=dev.addr,
+						addrType=dev.addrType, name=Thunderboard.FromScan(dev).name)
+			except Exception as e:
+				print("Thunderboard scan failed: " + str(e))
+			time.sleep(self.interval if self.registry.Ids() else 1)
+
 	def getThunderboards(self):
-		''' Collects all available thunderboards
+		''' Collects all available thunderboards, only
+			reads their advertisements, nothing is connected
 		'''
 		scanner = Scanner(0)
 		devices = scanner.scan(3)
@@ -166,60 +224,89 @@ class ThunderboardHandler(threading.Thread):
 				if desc == 'Complete Local Name':
 					if 'Thunder Sense #' in value:
 						deviceId = int(value.split('#')[-1])
-						tbsense[deviceId] = Thunderboard(dev)
+						tbsense[deviceId] = dev
 
 		return tbsense
 
-	def sensorLoop(self, tb, devId):
-		''' Collects all reading into a dict, 
-			and returns it.
-		'''
-		
-		value = tb.char['power_source_type'].read()
-		if ord(value) == 0x04:
-			tb.coinCell = True
-
-
-
-		text = ''
-		text += '\n' + tb.name + '\n'
-		data = dict()
-
-		for key in tb.char.keys():
-			if key == 'temperature':
-				data['temperature'] = tb.readTemperature()
-				text += 'Temperature:\t{} C\n'.format(data['temperature'])
-			elif key == 'humidity':
-				data['humidity'] = tb.readHumidity()
-				text += 'Humidity:\t{} %RH\n'.format(data['humidity'])
-			
-			elif key == 'ambientLight':
-				data['ambientLight'] = tb.readAmbientLight()
-				text += 'Ambient Light:\t{} Lux\n'.format(data['ambientLight'])
-
-			elif key == 'uvIndex':
-				data['uvIndex'] = tb.readUvIndex()
-				text += 'UV Index:\t{}\n'.format(data['uvIndex'])
-
-			elif key == 'co2' and tb.coinCell == False:
-				data['co2'] = tb.readCo2()
-				text += 'eCO2:\t\t{}\n'.format(data['co2'])
-
-			elif key == 'voc' and tb.coinCell == False:
-				data['voc'] = tb.readVoc()
-				text += 'tVOC:\t\t{}\n'.format(data['voc'])
 
-			elif key == 'sound':
-				data['sound'] = tb.readSound()
-				text += 'Sound Level:\t{}\n'.format(data['sound'])
-
-			elif key == 'pressure':
-				data['pressure'] = tb.readPressure()
-				text += 'Pressure:\t{}\n'.format(data['pressure'])
-
-
-		return data
+class BoardWorker(threading.Thread):
+	''' Reads one board on its own thread and hands every
+		reading to _onReading(deviceId, data, interval). Connects
+		straight to the registered address, reusing cached handles,
+		and reconnects with exponential backoff after errors.
+		_policy(board) gives the (on, off) sampling interval for
+		the board's power source. While _present() is false the
+		board is unsubscribed and polled at the off interval, so
+		its radio stays quiet in between.
+	'''
+	MIN_BACKOFF = 1		# seconds
+	MAX_BACKOFF = 60
+	PRESENCE_CHECK = 1	# seconds, how quickly an idle worker notices the display
 
+	def __init__(self, _deviceId, _registry, _policy, _present, _onReading, _subscribe):
+		self.deviceId = _deviceId
+		self.registry = _registry
+		self.policy = _policy
+		self.present = _present
+		self.onReading = _onReading
+		self.subscribe = _subscribe
+		self.board = None
+		self.reconnects = 0
+		self.samples = 0
+		threading.Thread.__init__(self)
+		self.daemon = True
+		self.start()
 
+	def run(self):
+		backoff = self.MIN_BACKOFF
+		while True:
+			entry = self.registry.Get(self.deviceId)
+			self.board = Thunderboard(entry['addr'], entry['addrType'],
+				entry['name'], entry['handles'])
+			cached = bool(entry['handles'])
+			connected = sampled = False
+			try:
+				self.board.Connect()
+				connected = True
+				if not cached:
+					self.registry.Update(self.deviceId, handles=self.board.handles)
+				notifying = False
+				while True:
+					present = self.present()
+					active, idle = self.policy(self.board)
+					if present and self.subscribe and not notifying:
+						self.board.Subscribe()
+						notifying = True
+					elif not present and notifying:
+						self.board.Unsubscribe()
+						notifying = False
+					data = self.board.Sample(active if present else 0)
+					self.onReading(self.deviceId, data, active if present else idle)
+					self.samples += 1
+					sampled = True
+					backoff = self.MIN_BACKOFF
+					if not present:
+						self.Idle(idle)
+			except (IOError, BTLEException) as e:
+				print("sensorloop error on board " + str(self.deviceId) + ": " + str(e))
+			except Exception:
+				# A short or garbled payload, reconnect like for a radio error
+				print("sensorloop failed on board " + str(self.deviceId) + ":")
+				print_exc()
+			self.board.Disconnect()
+			if cached and connected and not sampled:
+				# Handles may be stale after a firmware update, rediscover
+				self.registry.Update(self.deviceId, handles=None)
+			self.reconnects += 1
+			time.sleep(backoff)
+			backoff = min(backoff * 2, self.MAX_BACKOFF)
 
-	
+	def Idle(self, _seconds):
+		''' Sleeps up to _seconds, returns early once someone is
+			looking at the display again '''
+		deadline = time.monotonic() + _seconds
+		while not self.present():
+			remaining = deadline - time.monotonic()
+			if remaining <= 0:
+				return
+			time.sleep(min(remaining, self.PRESENCE_CHECK))
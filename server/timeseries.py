@@ -0,0 +1,183 @@
+#!/usr/bin/python3
+import time
+import threading
+import statistics
+from array import array
+
+try:
+	import numpy as np
+except ImportError:			# Slower pure Python queries
+	np = None
+
+# Points kept per device and metric at each resolution
+RAW_CAPACITY = 4096			# every reading, ~13 minutes at 5 per second
+MINUTE_CAPACITY = 1440		# one day
+HOUR_CAPACITY = 24 * 30		# thirty days
+RESOLUTIONS = ('raw', 'minute', 'hour')
+AGGREGATES = ('mean', 'min', 'max', 'median', 'last', 'count')
+
+
+class Ring():
+	''' Fixed size columns of timestamps and values, the oldest
+		point is overwritten once full. '''
+	def __init__(self, _capacity: int):
+		self.capacity = _capacity
+		self.times = array('d', bytes(8 * _capacity))
+		self.values = array('d', bytes(8 * _capacity))
+		self.next = 0		# slot the next point goes to
+		self.count = 0
+
+	def Append(self, _time: float, _value: float):
+		self.times[self.next] = _time
+		self.values[self.next] = _value
+		self.next = (self.next + 1) % self.capacity
+		self.count = min(self.count + 1, self.capacity)
+
+	def Oldest(self) -> float:
+		if self.count == 0:
+			return float('inf')
+		return self.times[(self.next - self.count) % self.capacity]
+
+	def Since(self, _start: float):
+		''' (times, values) at or after _start, oldest first. Numpy
+		arrays when numpy is installed, lists otherwise. '''
+		first = (self.next - self.count) % self.capacity
+		if np is not None:
+			times = np.roll(np.frombuffer(self.times, dtype=np.float64), -first)[:self.count]
+			values = np.roll(np.frombuffer(self.values, dtype=np.float64), -first)[:self.count]
+			start = np.searchsorted(times, _start)
+			return times[start:], values[start:]
+		order = [(first + i) % self.capacity for i in range(self.count)]
+		points = [(self.times[i], self.values[i]) for i in order if self.times[i] >= _start]
+		return [point[0] for point in points], [point[1] for point in points]
+
+
+class Bucket():
+	''' Running mean of the points in one time bucket '''
+	def __init__(self, _width: float):
+		self.width = _width
+		self.start = None
+		self.total = 0.0
+		self.count = 0
+
+	def Add(self, _time: float, _value: float):
+		''' Returns (bucket start, mean) when _time closes the
+		current bucket, otherwise None '''
+		start = _time - _time % self.width
+		closed = None
+		if self.start is not None and start != self.start:
+			closed = (self.start, self.total / self.count)
+			self.total = 0.0
+			self.count = 0
+		self.start = start
+		self.total += _value
+		self.count += 1
+		return closed
+
+
+class Series():
+	''' One metric of one device at raw, minute and hour resolution '''
+	def __init__(self):
+		self.rings = {
+			'raw': Ring(RAW_CAPACITY),
+			'minute': Ring(MINUTE_CAPACITY),
+			'hour': Ring(HOUR_CAPACITY)
+		}
+		self.minute = Bucket(60)
+		self.hour = Bucket(3600)
+
+	def Append(self, _time: float, _value: float):
+		self.rings['raw'].Append(_time, _value)
+		closed = self.minute.Add(_time, _value)
+		if closed is not None:
+			self.rings['minute'].Append(*closed)
+			closed = self.hour.Add(*closed)
+			if closed is not None:
+				self.rings['hour'].Append(*closed)
+
+
+class SensorHistory():
+	''' Sensor readings by device and metric in fixed memory '''
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.series = dict()		# (device ID, metric) -> Series
+
+	def Record(self, _deviceId, _reading: dict, _time=None):
+		''' Stores every numeric value of a reading '''
+		stamp = time.time() if _time is None else _time
+		with self.lock:
+			for metric, value in _reading.items():
+				if isinstance(value, (int, float)) and not isinstance(value, bool):
+					key = (_deviceId, metric)
+					if key not in self.series:
+						self.series[key] = Series()
+					self.series[key].Append(stamp, value)
+
+	def Devices(self) -> list:
+		with self.lock:
+			return sorted(set(deviceId for deviceId, metric in self.series))
+
+	def Query(self, _metric: str, _window: float, _aggregate='mean',
+			_deviceId=None, _resolution=None, _points=False) -> dict:
+		''' Aggregates _metric over the last _window seconds, across
+		every device unless _deviceId is given. _resolution defaults
+		to the finest one that still covers the window. '''
+		if _aggregate not in AGGREGATES:
+			raise ValueError("Unknown aggregate " + str(_aggregate))
+		if _resolution is not None and _resolution not in RESOLUTIONS:
+			raise ValueError("Unknown resolution " + str(_resolution))
+		start = time.time() - _window
+		with self.lock:
+			series = [item for (deviceId, metric), item in self.series.items()
+				if metric == _metric and (_deviceId is None or deviceId == _deviceId)]
+			resolution = _resolution or self.__Resolution(series, start)
+			columns = [item.rings[resolution].Since(start) for item in series]
+		times, values = self.__Join(columns)
+		result = {'metric': _metric, 'device': _deviceId, 'window': _window,
+			'resolution': resolution, 'aggregate': _aggregate,
+			'count': len(values), 'value': self.__Aggregate(_aggregate, values)}
+		if _points:
+			result['points'] = [[float(t), float(v)] for t, v in zip(times, values)]
+		return result
+
+	@staticmethod
+	def __Resolution(_series, _start) -> str:
+		''' Finest resolution whose data reaches back to _start '''
+		for resolution in RESOLUTIONS[:-1]:
+			if all(item.rings[resolution].Oldest() <= _start or
+					item.rings[resolution].count < item.rings[resolution].capacity
+					for item in _series):
+				return resolution
+		return RESOLUTIONS[-1]
+
+	@staticmethod
+	def __Join(_columns):
+		if np is not None:
+			if not _columns:
+				return np.empty(0), np.empty(0)
+			times = np.concatenate([column[0] for column in _columns])
+			values = np.concatenate([column[1] for column in _columns])
+			order = np.argsort(times, kind='stable')
+			return times[order], values[order]
+		points = sorted(point for column in _columns for point in zip(*column))
+		return [point[0] for point in points], [point[1] for point in points]
+
+	@staticmethod
+	def __Aggregate(_aggregate, _values):
+		if len(_values) == 0:
+			return None
+		if _aggregate == 'count':
+			return len(_values)
+		if _aggregate == 'last':
+			return float(_values[-1])
+		if np is not None:
+			function = {'mean': np.mean, 'min': np.min, 'max': np.max,
+				'median': np.median}[_aggregate]
+			return float(function(_values))
+		function = {'mean': statistics.fmean, 'min': min, 'max': max,
+			'median': statistics.median}[_aggregate]
+		return float(function(_values))
+
+
+# Fed by the Thunderboard handler, read by the history endpoint
+history = SensorHistory()
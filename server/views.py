@@ -1,13 +1,26 @@
-from server import flask, gui, timer
+import server
+from server import flask, boot
 from flask import jsonify, request, render_template
 import json
+import copy
+import math
 import requests
 from datetime import datetime
 import server.gui_positions as gp
 from server import timer
+from server.httpclient import client
+from server.timeseries import history
+from server.lifecycle import wakeups
+import config
+from concurrent import futures
 
+STATS_TIMEOUT = 2		# seconds to wait for stats collected on the GUI thread
 
 
+def Starting(_subsystem: str):
+	''' Answer for endpoints whose subsystem hasn't booted yet '''
+	return jsonify({'Error': _subsystem + ' is still starting'}), 503
+
 
 #WebServer routing
 @flask.route('/')
@@ -20,8 +33,11 @@ def blank():
 #---------------------------------------------------
 @flask.route('/alexa', methods = ['POST'])
 def alexaResponse():
+	gui = server.gui
+	if gui is None:
+		return Starting('GUI')
 	json = request.get_json()
-	gui.UpdateAlexa(json["title"], json["text"], datetime.now())
+	gui.Post(gui.UpdateAlexa, json["title"], json["text"], datetime.now())
 	return jsonify({'response' : 'Update Ok'}) #to use with Dict
 
 #---------------------------------------------------
@@ -30,12 +46,18 @@ def alexaResponse():
 @flask.route('/move', methods = ['GET', 'POST'])
 def moveInterfaceItems():
 	if request.method == 'POST':
+		gui = server.gui
+		if gui is None:
+			return Starting('GUI')
 		json = request.get_json()
 		try:
 			position = gp.PositionResolver(json['position'])
 			if position == None:
 				return jsonify({'Error': 'Nonexistent position'})
-			if gui.ChangeFramePosition(json["widget"], position):
+			widget = json["widget"]
+			if widget in config.framePositions:
+				# Applied by the GUI thread, no need to wait for it
+				gui.Post(gui.ChangeFramePosition, widget, position, key=('move', widget))
 				timer.RestartTimer()
 				return jsonify({'response' : 'Update Ok'})
 			else:
@@ -52,37 +74,181 @@ def moveInterfaceItems():
 @flask.route('/toggle', methods = ['GET', 'POST'])
 def changeUI():
 	if request.method == 'POST':
+		gui = server.gui
+		if gui is None:
+			return Starting('GUI')
 		try:
-			json = request.json()
+			json = request.get_json()
 			widget = json['widget']
 			state = json['state']
+			if widget != 'all' and widget not in config.framePositions:
+				return jsonify({'Error': ('Update Failed on ' + widget)})
 			if state == 'on':
 				if widget == 'all':
-					if gui.GuiOn():
-						timer.RestartTimer()
-						return jsonify({'response' : 'Update Ok'})
-					else:
-						return jsonify({'Error': 'Update Failed on ToggleAll()'})
+					gui.Post(gui.GuiOn, key="power")
 				else:
-					if gui.ShowFrame(widget):
-						timer.RestartTimer()
-						return jsonify({'response' : 'Update Ok'})
-					else:
-						return jsonify({'Error': ('Update Failed on ' + widget)})
+					gui.Post(gui.ShowFrame, widget, key=('visible', widget))
 			elif state == 'off':
 				if widget == 'all':
-					if gui.GuiOff():
-						timer.RestartTimer()
-						return jsonify({'response' : 'Update Ok'})
-					else:
-						return jsonify({'Error': 'Update Failed on GuiOff()'})
+					gui.Post(gui.GuiOff, key="power")
 				else:
-					pass
-					if gui.HideFrame(widget):
-						timer.RestartTimer()
-						return jsonify({'response' : 'Update Ok'})
-					else:
-						return jsonify({'Error': ('Update Failed on ' + widget)})
+					gui.Post(gui.HideFrame, widget, key=('visible', widget))
+			else:
+				return jsonify({'Error': 'Nonexistent state'})
+			timer.RestartTimer()
+			return jsonify({'response' : 'Update Ok'})
 		except KeyError:
 			return jsonify({"Error": "Wrong json structure"})
-	
+	else:
+		return "Example json: {'widget': 'widgetname', 'state': 'on'}"
+
+#---------------------------------------------------
+# Applies many layout changes at once, saves and
+# recalls named layouts
+#---------------------------------------------------
+def ParseOperation(_operation: dict) -> tuple:
+	''' (operation, widget, value) for BuildGUI.ApplyLayout,
+	raises KeyError or ValueError if the operation is invalid '''
+	widget = _operation['widget']
+	if widget != 'all' and widget not in config.framePositions:
+		raise ValueError('Wrong widget name ' + str(widget))
+	if _operation['op'] == 'move' and widget != 'all':
+		position = gp.PositionResolver(_operation['position'])
+		if position is None:
+			raise ValueError('Nonexistent position ' + str(_operation['position']))
+		return ('move', widget, position)
+	elif _operation['op'] == 'weight' and widget != 'all':
+		weight = float(_operation['weight'])
+		if not math.isfinite(weight):
+			raise ValueError('Weight of ' + widget + ' has to be finite')
+		return ('weight', widget, weight)
+	elif _operation['op'] == 'toggle':
+		if _operation['state'] == 'on':
+			return ('show', widget, 1)			# Same weighting as /toggle
+		elif _operation['state'] == 'off':
+			return ('hide', widget, -1)
+		raise ValueError('Nonexistent state ' + str(_operation['state']))
+	raise ValueError('Unknown operation ' + str(_operation['op']) + ' on ' + str(widget))
+
+def RecallOperations(_name: str) -> list:
+	''' Operations that restore a saved layout, raises ValueError
+	if it names an unknown position or lacks a weight '''
+	with config.settingsLock:
+		layout = copy.deepcopy(config.NamedLayouts[_name])
+	operations = []
+	for widget, position in layout['positions'].items():
+		if widget in config.framePositions:
+			if gp.PositionResolver(position) is None:
+				raise ValueError('Layout ' + _name + ' has an unknown position ' + str(position))
+			if widget not in layout['weights']:
+				raise ValueError('Layout ' + _name + ' has no weight for ' + widget)
+			operations.append(('move', widget, gp.PositionResolver(position)))
+			operations.append(('weight', widget, float(layout['weights'][widget])))
+	operations.append(('hide', 'all', 0))
+	for widget in layout['shown']:
+		if widget in config.framePositions and widget not in config.OVERLAY_NAMES:
+			operations.append(('show', widget, 0))
+	return operations
+
+@flask.route('/layout', methods = ['GET', 'POST'])
+def batchLayout():
+	if request.method == 'GET':
+		with config.settingsLock:
+			current = {'positions': {widget: position.name for widget, position
+				in config.framePositions.items()}, 'weights': dict(config.frameWeights),
+				'layouts': sorted(config.NamedLayouts)}
+		return jsonify(current)
+	gui = server.gui
+	if gui is None:
+		return Starting('GUI')
+	try:
+		json = request.get_json()
+		operations = []
+		if 'recall' in json:
+			if json['recall'] not in config.NamedLayouts:
+				return jsonify({'Error': 'Unknown layout ' + str(json['recall'])})
+			operations += RecallOperations(json['recall'])
+		operations += [ParseOperation(operation) for operation in json.get('operations', [])]
+		save = json.get('save')
+		if not operations and save is None:
+			return jsonify({'Error': 'Nothing to do'})
+		if save is not None and not config.LAYOUT_NAME.fullmatch(str(save)):
+			return jsonify({'Error': 'Layout names can only have letters, digits, spaces, _ and -'})
+	except (KeyError, TypeError):
+		return jsonify({'Error': 'Wrong json structure'})
+	except ValueError as e:
+		return jsonify({'Error': str(e)})
+	# One GUI command and one countdown restart for the whole batch
+	gui.Post(gui.ApplyLayout, operations, save)
+	timer.RestartTimer()
+	return jsonify({'response': 'Update Ok', 'operations': len(operations)})
+
+#---------------------------------------------------
+# Upstream request counters
+#---------------------------------------------------
+@flask.route('/stats/http', methods = ['GET'])
+def httpStats():
+	return jsonify(client.Stats())
+
+#---------------------------------------------------
+# Tk thread wakeups with the display on and off
+#---------------------------------------------------
+@flask.route('/stats/wakeups', methods = ['GET'])
+def wakeupStats():
+	return jsonify(wakeups.Stats())
+
+#---------------------------------------------------
+# GUI startup times and widget build times
+#---------------------------------------------------
+@flask.route('/stats/gui', methods = ['GET'])
+def guiStats():
+	if server.gui is None:
+		return Starting('GUI')
+	return jsonify(server.gui.Timings())
+
+#---------------------------------------------------
+# Notification and Alexa card queue
+#---------------------------------------------------
+@flask.route('/stats/notifications', methods = ['GET'])
+def notificationStats():
+	gui = server.gui
+	if gui is None or not gui.ready.is_set():
+		return Starting('GUI')
+	# Collected on the Tk thread, which changes the queues
+	try:
+		stats = gui.Post(gui.notices.Stats, key='notificationStats').result(STATS_TIMEOUT)
+	except futures.TimeoutError:
+		return jsonify({'Error': 'GUI did not answer'}), 503
+	return jsonify(stats)
+
+#---------------------------------------------------
+# Config writes, changes are saved in the background
+#---------------------------------------------------
+@flask.route('/stats/config', methods = ['GET'])
+def configStats():
+	return jsonify(config.WriteStats())
+
+#---------------------------------------------------
+# Boot timeline, when each subsystem started and got ready
+#---------------------------------------------------
+@flask.route('/stats/boot', methods = ['GET'])
+def bootStats():
+	return jsonify(boot.Timeline())
+
+#---------------------------------------------------
+# Sensor history, aggregated over a time window
+#---------------------------------------------------
+@flask.route('/sensors/history', methods = ['GET'])
+def sensorHistory():
+	metric = request.args.get('metric')
+	if metric is None:
+		return jsonify({'Error': 'metric is required', 'devices': history.Devices()})
+	try:
+		window = float(request.args.get('window', 3600))
+		device = request.args.get('device')
+		device = int(device) if device is not None else None
+		points = request.args.get('points', 'false') == 'true'
+		return jsonify(history.Query(metric, window, request.args.get('agg', 'mean'),
+			device, request.args.get('resolution'), points))
+	except ValueError as e:
+		return jsonify({'Error': str(e)})
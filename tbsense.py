@@ -1,101 +1,227 @@
 #!/usr/bin/python3
 from bluepy.btle import *
 import struct
-from time import sleep
+from time import sleep, monotonic
+
+# Characteristic UUID -> reading name
+UUIDS = {
+   UUID('2a6e'): 'temperature',
+   UUID('2a6f'): 'humidity',
+   UUID('2a76'): 'uvIndex',
+   UUID('2a6d'): 'pressure',
+   UUID('c8546913-bfd9-45eb-8dde-9f8754f4a32e'): 'ambientLight',
+   UUID('c8546913-bf02-45eb-8dde-9f8754f4a32e'): 'sound',
+   UUID('efd658ae-c401-ef33-76e7-91b00019103b'): 'co2',
+   UUID('efd658ae-c402-ef33-76e7-91b00019103b'): 'voc',
+   UUID('ec61a454-ed01-a5e8-b8f9-de9ec026ec51'): 'power_source_type'
+}
+
+# Characteristics the board pushes when subscribed to,
+# anything else is read on every sample
+ENVIRONMENTAL = ('temperature', 'humidity', 'uvIndex', 'pressure',
+   'ambientLight', 'sound', 'co2', 'voc')
+CCCD_UUID = 0x2902
+NOTIFY_ON = b'\x01\x00'
+INDICATE_ON = b'\x02\x00'
+NOTIFY_OFF = b'\x00\x00'
+
+# power_source_type value -> name
+POWER_SOURCES = {0: 'unknown', 1: 'usb', 2: 'aa', 3: 'aaa', 4: 'coinCell'}
+
+# name -> (raw format, divisor), None keeps the raw integer
+FORMATS = {
+   'temperature': (struct.Struct('<H'), 100),
+   'humidity': (struct.Struct('<H'), 100),
+   'ambientLight': (struct.Struct('<L'), 100),
+   'uvIndex': (struct.Struct('<B'), None),
+   'co2': (struct.Struct('<h'), None),
+   'voc': (struct.Struct('<h'), None),
+   'sound': (struct.Struct('<h'), 100),
+   'pressure': (struct.Struct('<L'), 1000),
+   'power_source_type': (struct.Struct('<B'), None)
+}
+
+
+def Decode(name, raw):
+   ''' Raw characteristic value -> reading '''
+   layout, divisor = FORMATS[name]
+   value = layout.unpack(raw)[0]
+   return value if divisor is None else value / divisor
+
+
+class NotificationDelegate(DefaultDelegate):
+   ''' Decodes notifications as they arrive into board.latest '''
+
+   def __init__(self, board):
+      DefaultDelegate.__init__(self)
+      self.board = board
+
+   def handleNotification(self, cHandle, data):
+      name = self.board.byHandle.get(cHandle)
+      if name is not None:
+         self.board.latest[name] = Decode(name, data)
 
-class Thunderboard:
 
-   def __init__(self, dev):
-      self.dev  = dev
-      self.char = dict()
-      self.name = ''
+class Thunderboard:
+   ''' One board, addressed by its BLE address. Nothing is opened
+       until Connect(). Characteristic handles found on the first
+       connection can be passed back in later to skip discovery.
+   '''
+
+   def __init__(self, addr, addrType, name='', handles=None):
+      self.addr = addr
+      self.addrType = addrType
+      self.name = name
       self.session = ''
       self.coinCell = False
-
-      # Get device name and characteristics
-
-      scanData = dev.getScanData()
-
-      for (adtype, desc, value) in scanData:
+      self.powerSource = 'unknown'
+      self.peripheral = None
+      # name -> {'value': handle, 'properties': int, 'cccd': handle or None}
+      self.handles = handles or dict()
+      self.byHandle = dict()     # value handle -> name, for notifications
+      self.latest = dict()       # name -> last notified reading
+      self.subscribed = set()
+      # Batch read timing
+      self.batches = 0
+      self.batchSeconds = 0.0
+      self.lastBatchSeconds = 0.0
+
+   @classmethod
+   def FromScan(cls, dev):
+      ''' Board for a device found by a Scanner '''
+      name = ''
+      for (adtype, desc, value) in dev.getScanData():
          if (desc == 'Complete Local Name'):
-            self.name = value
-
-      ble_service = Peripheral()
-      ble_service.connect(dev.addr, dev.addrType)
-      characteristics = ble_service.getCharacteristics()
-
-      for k in characteristics:
-         if k.uuid == '2a6e':
-            self.char['temperature'] = k
-            
-         elif k.uuid == '2a6f':
-            self.char['humidity'] = k
-            
-         elif k.uuid == '2a76':
-            self.char['uvIndex'] = k
-            
-         elif k.uuid == '2a6d':
-            self.char['pressure'] = k
-            
-         elif k.uuid == 'c8546913-bfd9-45eb-8dde-9f8754f4a32e':
-            self.char['ambientLight'] = k
-
-         elif k.uuid == 'c8546913-bf02-45eb-8dde-9f8754f4a32e':
-            self.char['sound'] = k
-
-         elif k.uuid == 'efd658ae-c401-ef33-76e7-91b00019103b':
-            self.char['co2'] = k
-
-         elif k.uuid == 'efd658ae-c402-ef33-76e7-91b00019103b':
-            self.char['voc'] = k
-
-         elif k.uuid == 'ec61a454-ed01-a5e8-b8f9-de9ec026ec51':
-            self.char['power_source_type'] = k
-
-   
+            name = value
+      return cls(dev.addr, dev.addrType, name)
+
+   def Connect(self):
+      ''' Opens the connection, kept until Disconnect() '''
+      self.peripheral = Peripheral(self.addr, self.addrType)
+      if not self.handles:
+         self.Discover()
+      self.byHandle = {entry['value']: name for name, entry in self.handles.items()}
+      self.latest.clear()
+      self.subscribed.clear()
+      if 'power_source_type' in self.handles:
+         self.powerSource = POWER_SOURCES.get(self.Read('power_source_type'), 'unknown')
+         self.coinCell = self.powerSource == 'coinCell'
+
+   def Disconnect(self):
+      if self.peripheral is not None:
+         try:
+            self.peripheral.disconnect()
+         except BTLEException:
+            pass
+         self.peripheral = None
+
+   def Discover(self):
+      ''' Full GATT discovery, fills self.handles '''
+      self.handles = dict()
+      for k in self.peripheral.getCharacteristics():
+         name = UUIDS.get(k.uuid)
+         if name is None:
+            continue
+         cccd = None
+         if k.properties & (Characteristic.props['NOTIFY'] | Characteristic.props['INDICATE']):
+            descriptors = k.getDescriptors(forUUID=CCCD_UUID)
+            if descriptors:
+               cccd = descriptors[0].handle
+         self.handles[name] = {'value': k.getHandle(),
+            'properties': k.properties, 'cccd': cccd}
+
+   def Wanted(self):
+      ''' Environmental characteristics worth reading on this board,
+          the gas sensor is off on coin cell power '''
+      return [name for name in ENVIRONMENTAL if name in self.handles and
+         not (self.coinCell and name in ('co2', 'voc'))]
+
+   def Subscribe(self):
+      ''' Turns on notify or indicate for every wanted characteristic
+          that supports it. Returns the names subscribed to. '''
+      self.peripheral.withDelegate(NotificationDelegate(self))
+      for name in self.Wanted():
+         entry = self.handles[name]
+         if entry['cccd'] is None:
+            continue
+         if entry['properties'] & Characteristic.props['NOTIFY']:
+            enable = NOTIFY_ON
+         else:
+            enable = INDICATE_ON
+         self.peripheral.writeCharacteristic(entry['cccd'], enable, withResponse=True)
+         self.subscribed.add(name)
+         # First value now, later ones arrive as notifications
+         self.latest[name] = self.Read(name)
+      return self.subscribed
+
+   def Unsubscribe(self):
+      ''' Turns every notification off again, later samples read
+          all characteristics '''
+      for name in list(self.subscribed):
+         self.peripheral.writeCharacteristic(self.handles[name]['cccd'],
+            NOTIFY_OFF, withResponse=True)
+         self.subscribed.discard(name)
+      self.latest.clear()
+
+   def Sample(self, timeout=0):
+      ''' Handles notifications for timeout seconds, then reads
+          whatever can't notify. Returns every wanted reading. '''
+      if self.subscribed:
+         deadline = monotonic() + timeout
+         while True:
+            self.peripheral.waitForNotifications(max(0, deadline - monotonic()))
+            if monotonic() >= deadline:
+               break
+      elif timeout:
+         sleep(timeout)
+      polled = [name for name in self.Wanted() if name not in self.subscribed]
+      data = self.ReadBatch(polled)
+      for name in self.subscribed:
+         if name in self.latest:
+            data[name] = self.latest[name]
+      return data
+
+   def ReadBatch(self, names):
+      ''' Reads the named characteristics in one pass, in handle
+          order, and decodes them into one reading. bluepy has no
+          ATT Read Multiple, so each handle is one ATT read. '''
+      if not names:
+         return dict()
+      start = monotonic()
+      order = sorted(names, key=lambda name: self.handles[name]['value'])
+      raw = [self.peripheral.readCharacteristic(self.handles[name]['value'])
+         for name in order]
+      self.lastBatchSeconds = monotonic() - start
+      self.batchSeconds += self.lastBatchSeconds
+      self.batches += 1
+      return {name: Decode(name, value) for name, value in zip(order, raw)}
+
+   def ReadRaw(self, name):
+      return self.peripheral.readCharacteristic(self.handles[name]['value'])
+
+   def Read(self, name):
+      return Decode(name, self.ReadRaw(name))
+
    def readTemperature(self):
-      value = self.char['temperature'].read()
-      value = struct.unpack('<H', value)
-      value = value[0] / 100
-      return value
+      return self.Read('temperature')
 
    def readHumidity(self):
-      value = self.char['humidity'].read()
-      value = struct.unpack('<H', value)
-      value = value[0] / 100
-      return value
+      return self.Read('humidity')
 
    def readAmbientLight(self):
-      value = self.char['ambientLight'].read()
-      value = struct.unpack('<L', value)
-      value = value[0] / 100
-      return value
+      return self.Read('ambientLight')
 
    def readUvIndex(self):
-      value = self.char['uvIndex'].read()
-      value = ord(value)
-      return value
+      return self.Read('uvIndex')
 
    def readCo2(self):
-      value = self.char['co2'].read()
-      value = struct.unpack('<h', value)
-      value = value[0]
-      return value
+      return self.Read('co2')
 
    def readVoc(self):
-      value = self.char['voc'].read()
-      value = struct.unpack('<h', value)
-      value = value[0]
-      return value
+      return self.Read('voc')
 
    def readSound(self):
-      value = self.char['sound'].read()
-      value = struct.unpack('<h', value)
-      value = value[0] / 100
-      return value
+      return self.Read('sound')
 
    def readPressure(self):
-      value = self.char['pressure'].read()
-      value = struct.unpack('<L', value)
-      value = value[0] / 1000
-      return value
+      return self.Read('pressure')
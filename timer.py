@@ -1,76 +1,81 @@
 #!/usr/bin/python3
 import time
+import math
+import os
 import threading
 
+# Seconds remaining as text, for other processes that poll it.
+# Only written when the Timer is created with _export=True.
+COUNTER_FILE = '/tmp/counter'
+
 
 class Timer(threading.Thread):
-	def __init__(self, _timeframe):
+	''' Countdown kept as a deadline on the monotonic clock.
+		The thread sleeps on a condition until the deadline passes
+		or the timer is restarted, then fires the expiry callback.
+	'''
+	def __init__(self, _timeframe, _onExpire=None, _export=False):
 		self.TIMEFRAME = _timeframe
-		self.lock = threading.Lock()
+		self.onExpire = _onExpire
+		self.export = _export
+		self.deadline = time.monotonic()	# Expired by default
+		self.expired = True
+		self.condition = threading.Condition()	# reentrant, onExpire may restart
 		threading.Thread.__init__(self)
 		self.daemon = True
+		self.__Export()
 		self.start()
-		
-			
+
+
 	def run(self):
-		self.__ZeroTimer()
 		while True:
-			if self.ReadTimer() > 0:
-				self.__DecrementTimer()
-			else:
-				pass
-			time.sleep(1)
-		
+			with self.condition:
+				# Nothing to count down, wait for a restart
+				while self.expired:
+					self.condition.wait()
+				remaining = self.deadline - time.monotonic()
+				if remaining > 0:
+					if self.export:
+						# The file holds whole seconds, wake when they change
+						self.__Export()
+						remaining = remaining % 1 or 1
+					# Woken early by RestartTimer, or deadline reached
+					self.condition.wait(remaining)
+					continue
+				self.expired = True
+				self.__Export()
+				# Still holding the lock, a restart can't come in between
+				# expiring and the callback and then be undone by it
+				if self.onExpire is not None:
+					self.onExpire()
+
 	def RestartTimer(self):
 		''' To be used when an user interacts with
 			the interface in any way.
 		'''
-		while self.lock.locked():
-			continue
-		self.lock.acquire()
-		counter = open('/tmp/counter', 'w')
-		value = str(self.TIMEFRAME)
-		counter.write(value)
-		counter.close()
-		self.lock.release()
-		
+		with self.condition:
+			self.deadline = time.monotonic() + self.TIMEFRAME
+			self.expired = False
+			self.condition.notify()
+			self.__Export()
 
-	def __ZeroTimer(self):
-		''' Set the timer file to default
-		'''
-		while self.lock.locked():
-			continue
-		self.lock.acquire()
-		counter = open('/tmp/counter', 'w')
-		value = str('0           ')
-		counter.write(value)
-		counter.close()
-		self.lock.release()
+	def SetTimeframe(self, _timeframe):
+		''' Countdown length from the next restart on '''
+		self.TIMEFRAME = _timeframe
 
-	def __DecrementTimer(self):
-		''' 
-		'''
-		while self.lock.locked():
-			continue
-		self.lock.acquire()
-		counter = open('/tmp/counter', 'r+')
-		value = counter.read()
-		temp = int(value) - 1
-		# String with spaces to overwrite everything in file too
-		rewrite = str(temp) + "            "
-		counter.seek(0)
-		counter.write(rewrite)
-		counter.truncate()
-		counter.close()
-		self.lock.release()
+	def ReadTimer(self) -> int:
+		''' Remaining whole seconds, 0 when expired '''
+		remaining = self.deadline - time.monotonic()
+		if remaining <= 0:
+			return 0
+		return math.ceil(remaining)
 
-	def ReadTimer(self):
-		while self.lock.locked():
-			continue
-		self.lock.acquire()
-		counter = open('/tmp/counter', 'r')
-		tmp = counter.read()
-		value = int(tmp)
-		counter.close()
-		self.lock.release()
-		return value
+	def __Export(self):
+		''' Writes the remaining seconds to COUNTER_FILE,
+			the same text the file always held '''
+		if not self.export:
+			return
+		tmpFile = COUNTER_FILE + '.tmp'
+		with open(tmpFile, 'w') as counter:
+			counter.write(str(self.ReadTimer()))
+		os.replace(tmpFile, COUNTER_FILE)